@@ -0,0 +1,132 @@
+import os
+import time
+import argparse
+import psycopg2
+from dotenv import load_dotenv
+
+#сравнение запросов по пользователю до и после миграции таблицы operations
+#данные создаются во временных таблицах bench_operations_old и bench_operations_new
+#пример: python benchmark_operations.py --rows 10000000 --chats 10000
+
+load_dotenv()
+
+def get_db_connection():
+    return psycopg2.connect(
+        dbname=os.getenv('DB_NAME'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        host=os.getenv('DB_HOST')
+    )
+
+#старая схема: TEXT и FLOAT без индексов
+OLD_SCHEMA = """
+    CREATE TABLE bench_operations_old (
+        id SERIAL PRIMARY KEY,
+        date TEXT,
+        amount FLOAT,
+        chat_id BIGINT,
+        operation_type TEXT
+    )
+"""
+
+#новая схема: DATE и NUMERIC с индексами по пользователю
+NEW_SCHEMA = """
+    CREATE TABLE bench_operations_new (
+        id SERIAL PRIMARY KEY,
+        chat_id BIGINT,
+        operation_type TEXT,
+        date DATE,
+        amount NUMERIC(14, 2)
+    )
+"""
+
+NEW_INDEXES = [
+    "CREATE INDEX ON bench_operations_new (chat_id, date)",
+    "CREATE INDEX ON bench_operations_new (chat_id, id)",
+]
+
+#типичные запросы бота для одного пользователя
+QUERIES = {
+    'страница операций': (
+        "SELECT id, date, amount, operation_type FROM {table} "
+        "WHERE chat_id = %s AND id > 0 ORDER BY id LIMIT 21"
+    ),
+    'операции за месяц': (
+        "SELECT id, date, amount, operation_type FROM {table} "
+        "WHERE chat_id = %s AND date >= {month_start} AND date < {month_end}"
+    ),
+    'сумма за год': (
+        "SELECT operation_type, SUM(amount) FROM {table} "
+        "WHERE chat_id = %s AND date >= {year_start} AND date < {year_end} GROUP BY operation_type"
+    ),
+}
+
+def fill_tables(cur, rows, chats):
+    cur.execute("DROP TABLE IF EXISTS bench_operations_old, bench_operations_new")
+    cur.execute(OLD_SCHEMA)
+    cur.execute(NEW_SCHEMA)
+    cur.execute("""
+        INSERT INTO bench_operations_old (date, amount, chat_id, operation_type)
+        SELECT to_char(DATE '2015-01-01' + (g %% 3650), 'YYYY-MM-DD'),
+               round((random() * 10000)::numeric, 2),
+               g %% %s,
+               CASE WHEN g %% 2 = 0 THEN 'ДОХОД' ELSE 'РАСХОД' END
+        FROM generate_series(1, %s) AS g
+    """, (chats, rows))
+    cur.execute("""
+        INSERT INTO bench_operations_new (id, chat_id, operation_type, date, amount)
+        SELECT id, chat_id, operation_type, date::date, amount::numeric(14, 2)
+        FROM bench_operations_old
+    """)
+    for statement in NEW_INDEXES:
+        cur.execute(statement)
+    cur.execute("ANALYZE bench_operations_old")
+    cur.execute("ANALYZE bench_operations_new")
+
+def time_query(cur, query, chat_ids):
+    started = time.perf_counter()
+    for chat_id in chat_ids:
+        cur.execute(query, (chat_id,))
+        cur.fetchall()
+    return (time.perf_counter() - started) / len(chat_ids) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='Время запросов к operations до и после миграции')
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--chats', type=int, default=10000)
+    parser.add_argument('--samples', type=int, default=50)
+    parser.add_argument('--keep', action='store_true', help='не удалять таблицы после замера')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        print(f"Заполнение {args.rows} строк для {args.chats} пользователей...")
+        started = time.perf_counter()
+        fill_tables(cur, args.rows, args.chats)
+        conn.commit()
+        print(f"Готово за {time.perf_counter() - started:.1f} с\n")
+
+        chat_ids = [i * args.chats // args.samples for i in range(args.samples)]
+        tables = {
+            'до миграции': ('bench_operations_old', "'2020-03-01'", "'2020-04-01'", "'2020-01-01'", "'2021-01-01'"),
+            'после миграции': ('bench_operations_new', "DATE '2020-03-01'", "DATE '2020-04-01'",
+                               "DATE '2020-01-01'", "DATE '2021-01-01'"),
+        }
+
+        print(f"{'запрос':<20} {'схема':<16} {'мс на пользователя':>20}")
+        for name, query in QUERIES.items():
+            for schema, (table, month_start, month_end, year_start, year_end) in tables.items():
+                sql = query.format(table=table, month_start=month_start, month_end=month_end,
+                                   year_start=year_start, year_end=year_end)
+                print(f"{name:<20} {schema:<16} {time_query(cur, sql, chat_ids):>20.3f}")
+    finally:
+        if not args.keep:
+            conn.rollback()
+            cur.execute("DROP TABLE IF EXISTS bench_operations_old, bench_operations_new")
+            conn.commit()
+        cur.close()
+        conn.close()
+
+if __name__ == '__main__':
+    main()
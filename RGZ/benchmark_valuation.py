@@ -0,0 +1,40 @@
+import time
+import random
+import argparse
+from array import array
+from valuation import value_operations, value_operations_loop
+
+#сравнение поэлементного и массового пересчета операций во все валюты
+#пример: python benchmark_valuation.py --operations 1000000
+
+RATES = {"RUB": 1.0, "EUR": 100.0, "USD": 90.0}
+
+def measure(function, amounts, is_income, repeats):
+    best = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function(amounts, is_income, RATES)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Скорость пересчета операций во все валюты')
+    parser.add_argument('--operations', type=int, default=1000000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(1)
+    amounts = array('d', (round(random.uniform(1, 100000), 2) for _ in range(args.operations)))
+    is_income = bytes(random.getrandbits(1) for _ in range(args.operations))
+
+    loop_time = measure(value_operations_loop, amounts, is_income, args.repeats)
+    bulk_time = measure(value_operations, amounts, is_income, args.repeats)
+
+    print(f"операций: {args.operations}, валют: {len(RATES)}")
+    print(f"поэлементно: {loop_time * 1000:.1f} мс")
+    print(f"массово:     {bulk_time * 1000:.1f} мс")
+    print(f"ускорение:   {loop_time / bulk_time:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,26 @@
 import os
+import sys
+import time
 import logging
+import aiohttp
 from dotenv import load_dotenv
 import psycopg2
-from aiogram import Bot, Dispatcher, types
+from collections import OrderedDict
+from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import asyncio
+from array import array
 from datetime import datetime  
+from prometheus_client import CollectorRegistry, Counter, start_http_server
+from valuation import value_operations
+#общие модули лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import query_stats
+from bot_common import setup_metrics, setup_query_stats, run_bot
 
 #загрузка переменных окружения
 load_dotenv()
@@ -14,21 +28,182 @@ load_dotenv()
 #настройка логирования
 logging.basicConfig(level=logging.INFO)
 
+#ограничения хранилища состояний диалогов
+STATE_STORAGE_MAX_SIZE = int(os.getenv('STATE_STORAGE_MAX_SIZE', '10000'))
+STATE_STORAGE_TTL = float(os.getenv('STATE_STORAGE_TTL', '3600'))
+
+#хранилище состояний с ограничением размера и временем жизни записей
+class BoundedMemoryStorage(BaseStorage):
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        #ключ -> [состояние, данные, время истечения], самые старые в начале
+        self.records = OrderedDict()
+
+    #удаление просроченных и лишних записей
+    def evict(self):
+        now = time.monotonic()
+        while self.records:
+            key, record = next(iter(self.records.items()))
+            if record[2] > now and len(self.records) <= self.max_size:
+                break
+            del self.records[key]
+
+    #запись с продлением срока жизни
+    def touch(self, key):
+        record = self.records.get(key)
+        if record is None or record[2] <= time.monotonic():
+            record = [None, {}, 0]
+            self.records[key] = record
+        record[2] = time.monotonic() + self.ttl
+        self.records.move_to_end(key)
+        return record
+
+    #пустые записи не занимают память
+    def store(self, key, record):
+        if record[0] is None and not record[1]:
+            self.records.pop(key, None)
+        self.evict()
+
+    async def set_state(self, key, state=None):
+        record = self.touch(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self.store(key, record)
+
+    async def get_state(self, key):
+        record = self.records.get(key)
+        if record is None or record[2] <= time.monotonic():
+            return None
+        return record[0]
+
+    async def set_data(self, key, data):
+        record = self.touch(key)
+        record[1] = dict(data)
+        self.store(key, record)
+
+    async def get_data(self, key):
+        record = self.records.get(key)
+        if record is None or record[2] <= time.monotonic():
+            return {}
+        return dict(record[1])
+
+    async def close(self):
+        self.records.clear()
+
 #инициализация бота и диспетчера
 bot = Bot(token=os.getenv('API_TOKEN'))
-dp = Dispatcher()
+dp = Dispatcher(storage=BoundedMemoryStorage(STATE_STORAGE_MAX_SIZE, STATE_STORAGE_TTL))
+
+#метрики бота в формате Prometheus
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9104'))
+metrics_registry = CollectorRegistry()
+DB_CONNECTIONS = Counter('db_connections_total', 'Количество открытых соединений с базой данных',
+                         registry=metrics_registry)
+DB_CONNECTION_ERRORS = Counter('db_connection_errors_total', 'Количество ошибок подключения к базе данных',
+                               registry=metrics_registry)
+
+setup_metrics(dp, metrics_registry)
+
+#учет запросов к базе данных в каждом обработчике
+setup_query_stats(dp)
+
+#состояния диалогов
+class RegStates(StatesGroup):
+    username = State()
+
+class OperationStates(StatesGroup):
+    amount = State()
+    date = State()
+
+class DeleteStates(StatesGroup):
+    operation_id = State()
+
+#текст, который не является командой
+text_input = F.text & ~F.text.startswith('/')
+
+#валюты для отображения операций
+SUPPORTED_CURRENCIES = ["RUB", "EUR", "USD"]
+
+#число операций на одной странице списка
+OPERATIONS_PAGE_SIZE = int(os.getenv('OPERATIONS_PAGE_SIZE', '20'))
+
+#размер пакета при переносе данных в миграциях
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', '10000'))
+MIGRATION_LOCK_ID = 20240501
+
+#сервис курсов валют
+RATE_SERVER_URL = os.getenv('RATE_SERVER_URL', 'http://localhost:5000')
+RATE_REQUEST_TIMEOUT = float(os.getenv('RATE_REQUEST_TIMEOUT', '3'))
+RATE_CACHE_TTL = float(os.getenv('RATE_CACHE_TTL', '30'))
+
+#общая HTTP-сессия с постоянными соединениями
+http_session = None
+
+#кратковременный кэш курсов: валюта -> (курс, время истечения)
+rate_cache = {}
 
-#словарь для хранения временных данных операций
-operation_data = {}
+#получение HTTP-сессии
+def get_http_session():
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=RATE_REQUEST_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60)
+        )
+    return http_session
+
+#получение курса валюты с сервера
+async def get_rate(currency):
+    cached = rate_cache.get(currency)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
+    async with get_http_session().get(f"{RATE_SERVER_URL}/rate", params={'currency': currency}) as response:
+        if response.status != 200:
+            raise Exception(f"Не удалось получить курс валюты. Код ошибки: {response.status}")
+        rate_data = await response.json()
+
+    rate = rate_data['rate']
+    rate_cache[currency] = (rate, time.monotonic() + RATE_CACHE_TTL)
+    return rate
+
+#получение курсов нескольких валют одним запросом
+async def get_rates(currencies):
+    rates = {}
+    missing = []
+    for currency in currencies:
+        cached = rate_cache.get(currency)
+        if cached and cached[1] > time.monotonic():
+            rates[currency] = cached[0]
+        else:
+            missing.append(currency)
+
+    if missing:
+        async with get_http_session().get(f"{RATE_SERVER_URL}/rates", params={'currencies': ','.join(missing)}) as response:
+            if response.status != 200:
+                raise Exception(f"Не удалось получить курсы валют. Код ошибки: {response.status}")
+            rates_data = await response.json()
+        for currency, rate in rates_data['rates'].items():
+            rate_cache[currency] = (rate, time.monotonic() + RATE_CACHE_TTL)
+            rates[currency] = rate
+
+    return {currency: rates[currency] for currency in currencies}
 
 #подключение к базе данных
 def get_db_connection():
-    return psycopg2.connect(
-        dbname=os.getenv('DB_NAME'),
-        user=os.getenv('DB_USER'),
-        password=os.getenv('DB_PASSWORD'),
-        host=os.getenv('DB_HOST')
-    )
+    try:
+        conn = psycopg2.connect(
+            dbname=os.getenv('DB_NAME'),
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'),
+            host=os.getenv('DB_HOST'),
+            cursor_factory=query_stats.TracingCursor
+        )
+    except psycopg2.Error:
+        DB_CONNECTION_ERRORS.inc()
+        raise
+    DB_CONNECTIONS.inc()
+    return conn
 
 #создание таблиц
 def create_tables():
@@ -54,15 +229,155 @@ def create_tables():
     cur.close()
     conn.close()
 
-#проверка регистрации пользователя
-def is_user_registered(chat_id):
+#миграция 1: точные типы для даты и суммы операций
+def migrate_operations_types(conn):
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_name = 'operations' AND column_name = 'date'"
+    )
+    if cur.fetchone()[0] == 'date':
+        cur.close()
+        return
+
+    #новые столбцы без значения по умолчанию добавляются без перезаписи таблицы
+    cur.execute("""
+        ALTER TABLE operations
+            ADD COLUMN IF NOT EXISTS date_new DATE,
+            ADD COLUMN IF NOT EXISTS amount_new NUMERIC(14, 2)
+    """)
+    conn.commit()
+
+    #перенос данных пакетами по диапазонам id, каждый пакет в своей транзакции
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM operations")
+    max_id = cur.fetchone()[0]
+    last_id = 0
+    while last_id < max_id:
+        cur.execute(
+            "UPDATE operations SET date_new = date::date, amount_new = amount::numeric(14, 2) "
+            "WHERE id > %s AND id <= %s",
+            (last_id, last_id + MIGRATION_BATCH_SIZE)
+        )
+        conn.commit()
+        last_id += MIGRATION_BATCH_SIZE
+        logging.info(f"Миграция операций: обработано до id {min(last_id, max_id)} из {max_id}")
+
+    #короткая блокировка: строки, добавленные во время переноса, и замена столбцов
+    cur.execute("SET LOCAL lock_timeout = '10s'")
+    cur.execute("LOCK TABLE operations IN ACCESS EXCLUSIVE MODE")
+    cur.execute(
+        "UPDATE operations SET date_new = date::date, amount_new = amount::numeric(14, 2) "
+        "WHERE id > %s",
+        (max_id,)
+    )
+    cur.execute("ALTER TABLE operations DROP COLUMN date, DROP COLUMN amount")
+    cur.execute("ALTER TABLE operations RENAME COLUMN date_new TO date")
+    cur.execute("ALTER TABLE operations RENAME COLUMN amount_new TO amount")
+    conn.commit()
+    cur.close()
+
+#миграция 2: индексы для запросов по пользователю
+def migrate_operations_indexes(conn):
+    #CONCURRENTLY не блокирует запись, но требует режима autocommit
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS operations_chat_id_date_idx ON operations (chat_id, date)")
+        cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS operations_chat_id_id_idx ON operations (chat_id, id)")
+    finally:
+        cur.close()
+        conn.autocommit = False
+
+#миграция 3: накопительный баланс пользователя
+def migrate_balances(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS balances (
+            chat_id BIGINT PRIMARY KEY,
+            income NUMERIC(16, 2) NOT NULL DEFAULT 0,
+            expense NUMERIC(16, 2) NOT NULL DEFAULT 0,
+            operations_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    #начальные значения из уже сохраненных операций
+    cur.execute("""
+        INSERT INTO balances (chat_id, income, expense, operations_count)
+        SELECT chat_id,
+               COALESCE(SUM(amount) FILTER (WHERE operation_type = 'ДОХОД'), 0),
+               COALESCE(SUM(amount) FILTER (WHERE operation_type = 'РАСХОД'), 0),
+               COUNT(*)
+        FROM operations
+        GROUP BY chat_id
+        ON CONFLICT (chat_id) DO NOTHING
+    """)
+    cur.close()
+
+#изменение баланса в текущей транзакции (sign = 1 при добавлении, -1 при удалении)
+def apply_balance_change(cur, chat_id, op_type, amount, sign):
+    income = amount if op_type == "ДОХОД" else 0
+    expense = amount if op_type == "РАСХОД" else 0
+    cur.execute("""
+        INSERT INTO balances (chat_id, income, expense, operations_count)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (chat_id) DO UPDATE SET
+            income = balances.income + EXCLUDED.income,
+            expense = balances.expense + EXCLUDED.expense,
+            operations_count = balances.operations_count + EXCLUDED.operations_count
+    """, (chat_id, sign * income, sign * expense, sign))
+
+#список миграций, номер версии схемы равен позиции в списке
+MIGRATIONS = [
+    migrate_operations_types,
+    migrate_operations_indexes,
+    migrate_balances,
+]
+
+#применение недостающих миграций
+def run_migrations():
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE chat_id = %s", (chat_id,))
-    exists = cur.fetchone() is not None
+    try:
+        #одновременно миграции выполняет только один экземпляр бота
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        cur.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+        cur.execute("SELECT version FROM schema_version")
+        row = cur.fetchone()
+        if row is None:
+            cur.execute("INSERT INTO schema_version (version) VALUES (0)")
+            version = 0
+        else:
+            version = row[0]
+        conn.commit()
+
+        for number, migration in enumerate(MIGRATIONS, start=1):
+            if number <= version:
+                continue
+            logging.info(f"Применение миграции {number}: {migration.__name__}")
+            migration(conn)
+            cur.execute("UPDATE schema_version SET version = %s", (number,))
+            conn.commit()
+    finally:
+        conn.rollback()
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        cur.close()
+        conn.close()
+
+#множество chat_id зарегистрированных пользователей
+registered_chats = set()
+
+#загрузка зарегистрированных пользователей при запуске
+def load_registered_users():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT chat_id FROM users")
+    registered_chats.update(row[0] for row in cur.fetchall())
     cur.close()
     conn.close()
-    return exists
+    logging.info(f"Загружено пользователей: {len(registered_chats)}")
+
+#проверка регистрации пользователя
+def is_user_registered(chat_id):
+    return chat_id in registered_chats
 
 #/start
 @dp.message(Command('start'))
@@ -73,28 +388,71 @@ async def start(message: types.Message):
         "/reg - регистрация\n"
         "/add_operation - добавить операцию\n"
         "/operations - список операций\n"
-        "/delete_operation - удалить операцию по ID"
+        "/delete_operation - удалить операцию по ID\n"
+        "/balance - баланс"
     )
 
+#/balance
+@dp.message(Command('balance'))
+async def show_balance(message: types.Message):
+    if not is_user_registered(message.chat.id):
+        await message.answer("Сначала зарегистрируйтесь с помощью /reg")
+        return
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "SELECT income, expense, operations_count FROM balances WHERE chat_id = %s",
+            (message.chat.id,)
+        )
+        row = cur.fetchone()
+        
+        if not row or not row[2]:
+            await message.answer("Операций нет")
+            return
+        
+        income, expense, count = row
+        await message.answer(
+            f"Доходы: {income} RUB\n"
+            f"Расходы: {expense} RUB\n"
+            f"Баланс: {income - expense} RUB\n"
+            f"Операций: {count}"
+        )
+    except Exception as e:
+        await message.answer(f"Ошибка: {e}")
+    finally:
+        cur.close()
+        conn.close()
+
 #/reg
 @dp.message(Command('reg'))
-async def register(message: types.Message):
+async def register(message: types.Message, state: FSMContext):
     if is_user_registered(message.chat.id):
         await message.answer("Вы уже зарегистрированы!")
         return
     
+    await state.set_state(RegStates.username)
     await message.answer("Введите ваш логин:")
 
-# Обработчик ввода логина (для незарегистрированных пользователей)
-@dp.message(lambda message: not message.text.startswith('/') and not is_user_registered(message.chat.id))
-async def process_username(message: types.Message):
+# Обработчик ввода логина
+@dp.message(RegStates.username, text_input)
+async def process_username(message: types.Message, state: FSMContext):
+    await state.clear()
     conn = get_db_connection()
     cur = conn.cursor()
     try:
-        cur.execute("INSERT INTO users (chat_id, username) VALUES (%s, %s)", 
-                   (message.chat.id, message.text))
+        #пользователь мог зарегистрироваться в другом экземпляре бота
+        cur.execute(
+            "INSERT INTO users (chat_id, username) VALUES (%s, %s) ON CONFLICT (chat_id) DO NOTHING",
+            (message.chat.id, message.text)
+        )
         conn.commit()
-        await message.answer("Регистрация завершена!")
+        registered_chats.add(message.chat.id)
+        if cur.rowcount:
+            await message.answer("Регистрация завершена!")
+        else:
+            await message.answer("Вы уже зарегистрированы!")
     except Exception as e:
         await message.answer(f"Ошибка: {e}")
     finally:
@@ -103,7 +461,8 @@ async def process_username(message: types.Message):
 
 #/add_operation
 @dp.message(Command('add_operation'))
-async def add_operation(message: types.Message):
+async def add_operation(message: types.Message, state: FSMContext):
+    await state.clear()
     if not is_user_registered(message.chat.id):
         await message.answer("Сначала зарегистрируйтесь с помощью /reg")
         return
@@ -116,27 +475,33 @@ async def add_operation(message: types.Message):
 
 #выбор типа операции (колбэк)
 @dp.callback_query(lambda c: c.data in ["income", "expense"])
-async def process_operation_type(callback: types.CallbackQuery):
+async def process_operation_type(callback: types.CallbackQuery, state: FSMContext):
     operation_type = "ДОХОД" if callback.data == "income" else "РАСХОД"
-    operation_data[callback.message.chat.id] = {"type": operation_type}
+    await state.set_state(OperationStates.amount)
+    await state.set_data({"type": operation_type})
     await callback.message.answer("Введите сумму операции в рублях:")
     await callback.answer()
 
 #ввод суммы операции
-@dp.message(lambda message: message.text.replace('.', '', 1).isdigit() and message.chat.id in operation_data)
-async def process_amount(message: types.Message):
-    operation_data[message.chat.id]["amount"] = float(message.text)
+@dp.message(OperationStates.amount, text_input)
+async def process_amount(message: types.Message, state: FSMContext):
+    if not message.text.replace('.', '', 1).isdigit():
+        await message.answer("Введите сумму числом (например: 1500 или 1500.50):")
+        return
+    await state.update_data(amount=float(message.text))
+    await state.set_state(OperationStates.date)
     await message.answer("Введите дату операции (формат: ГГГГ-ММ-ДД):")
 
 #ввод даты операции
-@dp.message(lambda message: message.chat.id in operation_data and "amount" in operation_data[message.chat.id])
-async def process_date(message: types.Message):
+@dp.message(OperationStates.date, text_input)
+async def process_date(message: types.Message, state: FSMContext):
     try:
         #проверка корректности даты
         date = datetime.strptime(message.text, "%Y-%m-%d").date()
         chat_id = message.chat.id
-        op_type = operation_data[chat_id]["type"]
-        amount = operation_data[chat_id]["amount"]
+        data = await state.get_data()
+        op_type = data["type"]
+        amount = data["amount"]
         
         conn = get_db_connection()
         cur = conn.cursor()
@@ -144,10 +509,11 @@ async def process_date(message: types.Message):
             "INSERT INTO operations (date, amount, chat_id, operation_type) VALUES (%s, %s, %s, %s)",
             (date, amount, chat_id, op_type)
         )
+        apply_balance_change(cur, chat_id, op_type, amount, 1)
         conn.commit()
         
         await message.answer("Операция добавлена!")
-        operation_data.pop(chat_id, None)
+        await state.clear()
     except ValueError:
         await message.answer("Некорректный формат даты. Пожалуйста, введите дату в формате ГГГГ-ММ-ДД.")
     except Exception as e:
@@ -168,107 +534,241 @@ async def list_operations(message: types.Message):
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="RUB", callback_data="currency_RUB"),
          InlineKeyboardButton(text="EUR", callback_data="currency_EUR"),
-         InlineKeyboardButton(text="USD", callback_data="currency_USD")]
+         InlineKeyboardButton(text="USD", callback_data="currency_USD")],
+        [InlineKeyboardButton(text="ВСЕ ВАЛЮТЫ", callback_data="valuation")]
     ])
     await message.answer("Выберите валюту для отображения операций:", reply_markup=keyboard)
 
-#выбор валюты (колбэк)
-@dp.callback_query(lambda c: c.data.startswith("currency_"))
-async def show_operations(callback: types.CallbackQuery):
-    currency = callback.data.split("_")[1]
+#страница операций пользователя по ключу (chat_id, id)
+def fetch_operations_page(chat_id, cursor=0, backward=False):
     conn = get_db_connection()
     cur = conn.cursor()
-    
+    try:
+        if backward:
+            cur.execute(
+                "SELECT id, date, amount, operation_type FROM operations "
+                "WHERE chat_id = %s AND id < %s ORDER BY id DESC LIMIT %s",
+                (chat_id, cursor, OPERATIONS_PAGE_SIZE + 1)
+            )
+        else:
+            cur.execute(
+                "SELECT id, date, amount, operation_type FROM operations "
+                "WHERE chat_id = %s AND id > %s ORDER BY id LIMIT %s",
+                (chat_id, cursor, OPERATIONS_PAGE_SIZE + 1)
+            )
+        ops = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+    #лишняя строка показывает, есть ли еще страница в этом направлении
+    has_more = len(ops) > OPERATIONS_PAGE_SIZE
+    ops = ops[:OPERATIONS_PAGE_SIZE]
+    if backward:
+        ops.reverse()
+        return ops, has_more, True
+    return ops, cursor > 0, has_more
+
+#кнопки навигации по страницам операций
+def operations_page_keyboard(prefix, ops, has_prev, has_next):
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(text="← Назад", callback_data=f"{prefix}:prev:{ops[0][0]}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="Далее →", callback_data=f"{prefix}:next:{ops[-1][0]}"))
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+#вывод страницы операций в выбранной валюте
+async def send_operations_page(callback: types.CallbackQuery, currency, cursor=0, backward=False):
     try:
         #получение текущего курса валюты с сервера
-        import requests
         try:
-            response = requests.get(f"http://localhost:5000/rate?currency={currency}")
-            if response.status_code != 200:
-                raise Exception(f"Не удалось получить курс валюты. Код ошибки: {response.status_code}")
-            rate_data = response.json()
-            rate = rate_data['rate']
+            rate = await get_rate(currency)
+        except asyncio.TimeoutError:
+            await callback.message.answer("Ошибка при получении курса валюты: сервер не ответил вовремя")
+            await callback.answer()
+            return
         except Exception as e:
             await callback.message.answer(f"Ошибка при получении курса валюты: {e}")
             await callback.answer()
             return
 
-        cur.execute("SELECT id, date, amount, operation_type FROM operations WHERE chat_id = %s", (callback.message.chat.id,))
-        ops = cur.fetchall()
+        ops, has_prev, has_next = await asyncio.to_thread(
+            fetch_operations_page, callback.message.chat.id, cursor, backward
+        )
         
         if not ops:
             await callback.message.answer("Операций нет")
             await callback.answer()
             return
             
-        response = f"Ваши операции ({currency}):\n"
+        lines = [f"Ваши операции ({currency}):"]
         for op in ops:
-            amount_rub = op[2]
+            amount_rub = float(op[2])
             #конвертация
             converted_amount = round(amount_rub / rate, 2)
-            response += f"{op[0]}. {op[3]} {converted_amount} {currency} ({op[1]})\n"
+            lines.append(f"{op[0]}. {op[3]} {converted_amount} {currency} ({op[1]})")
         
-        await callback.message.answer(response)
+        keyboard = operations_page_keyboard(f"ops_{currency}", ops, has_prev, has_next)
+        if cursor:
+            await callback.message.edit_text("\n".join(lines), reply_markup=keyboard)
+        else:
+            await callback.message.answer("\n".join(lines), reply_markup=keyboard)
         await callback.answer()
     except Exception as e:
         await callback.message.answer(f"Ошибка: {e}")
         await callback.answer()
+
+#выбор валюты (колбэк)
+@dp.callback_query(lambda c: c.data.startswith("currency_"))
+async def show_operations(callback: types.CallbackQuery):
+    currency = callback.data.split("_")[1]
+    await send_operations_page(callback, currency)
+
+#переключение страниц операций (колбэк)
+@dp.callback_query(lambda c: c.data.startswith("ops_"))
+async def show_operations_page(callback: types.CallbackQuery):
+    prefix, direction, cursor = callback.data.split(":")
+    currency = prefix.split("_")[1]
+    await send_operations_page(callback, currency, int(cursor), direction == "prev")
+
+#суммы и типы всех операций пользователя в компактных массивах
+def fetch_operation_amounts(chat_id):
+    conn = get_db_connection()
+    #серверный курсор читает историю частями
+    cur = conn.cursor(name='operation_amounts')
+    cur.itersize = 10000
+    ids = array('q')
+    amounts = array('d')
+    is_income = bytearray()
+    try:
+        cur.execute("SELECT id, amount, operation_type FROM operations WHERE chat_id = %s ORDER BY id", (chat_id,))
+        for op_id, amount, op_type in cur:
+            ids.append(op_id)
+            amounts.append(float(amount))
+            is_income.append(op_type == "ДОХОД")
     finally:
         cur.close()
         conn.close()
+    return ids, amounts, is_income
+
+#пересчет всей истории во все валюты (колбэк)
+@dp.callback_query(F.data == "valuation")
+async def show_valuation(callback: types.CallbackQuery):
+    try:
+        try:
+            rates = await get_rates(SUPPORTED_CURRENCIES)
+        except asyncio.TimeoutError:
+            await callback.message.answer("Ошибка при получении курса валюты: сервер не ответил вовремя")
+            await callback.answer()
+            return
+        except Exception as e:
+            await callback.message.answer(f"Ошибка при получении курса валюты: {e}")
+            await callback.answer()
+            return
+
+        ids, amounts, is_income = await asyncio.to_thread(fetch_operation_amounts, callback.message.chat.id)
+        
+        if not ids:
+            await callback.message.answer("Операций нет")
+            await callback.answer()
+            return
+        
+        totals, values = await asyncio.to_thread(value_operations, amounts, is_income, rates)
+        
+        lines = [f"Итоги по {len(ids)} операциям:"]
+        for currency, total in totals.items():
+            lines.append(f"{currency}: доходы {total['income']}, расходы {total['expense']}, баланс {total['balance']}")
+        lines.append("")
+        lines.append("Последние операции:")
+        for k in range(max(0, len(ids) - OPERATIONS_PAGE_SIZE), len(ids)):
+            converted = ", ".join(f"{values[currency][k]:.2f} {currency}" for currency in totals)
+            lines.append(f"{ids[k]}. {'ДОХОД' if is_income[k] else 'РАСХОД'} {converted}")
+        
+        await callback.message.answer("\n".join(lines))
+        await callback.answer()
+    except Exception as e:
+        await callback.message.answer(f"Ошибка: {e}")
+        await callback.answer()
+
+#текст страницы операций для удаления
+def delete_operations_text(ops):
+    lines = ["Ваши операции (укажите ID для удаления):"]
+    for op in ops:
+        lines.append(f"{op[0]}. {op[3]} {op[2]} RUB ({op[1]})")
+    return "\n".join(lines) + "\n\nВведите ID операции для удаления:"
 
 #/delete_operation
 @dp.message(Command('delete_operation'))
-async def delete_operation(message: types.Message):
+async def delete_operation(message: types.Message, state: FSMContext):
+    await state.clear()
     if not is_user_registered(message.chat.id):
         await message.answer("Сначала зарегистрируйтесь с помощью /reg")
         return
     
-    #получение списка операций
-    conn = get_db_connection()
-    cur = conn.cursor()
+    #получение первой страницы операций
     try:
-        cur.execute("SELECT id, date, amount, operation_type FROM operations WHERE chat_id = %s", (message.chat.id,))
-        ops = cur.fetchall()
+        ops, has_prev, has_next = await asyncio.to_thread(fetch_operations_page, message.chat.id)
         
         if not ops:
             await message.answer("У вас нет операций для удаления")
             return
-            
-        response = "Ваши операции (укажите ID для удаления):\n"
-        for op in ops:
-            response += f"{op[0]}. {op[3]} {op[2]} RUB ({op[1]})\n"
         
-        await message.answer(response + "\nВведите ID операции для удаления:")
+        keyboard = operations_page_keyboard("delops", ops, has_prev, has_next)
+        await state.set_state(DeleteStates.operation_id)
+        await message.answer(delete_operations_text(ops), reply_markup=keyboard)
     except Exception as e:
         await message.answer(f"Ошибка: {e}")
-    finally:
-        cur.close()
-        conn.close()
+
+#переключение страниц операций для удаления (колбэк)
+@dp.callback_query(lambda c: c.data.startswith("delops:"))
+async def delete_operation_page(callback: types.CallbackQuery):
+    try:
+        _, direction, cursor = callback.data.split(":")
+        ops, has_prev, has_next = await asyncio.to_thread(
+            fetch_operations_page, callback.message.chat.id, int(cursor), direction == "prev"
+        )
+        
+        if not ops:
+            await callback.message.answer("У вас нет операций для удаления")
+            await callback.answer()
+            return
+        
+        keyboard = operations_page_keyboard("delops", ops, has_prev, has_next)
+        await callback.message.edit_text(delete_operations_text(ops), reply_markup=keyboard)
+        await callback.answer()
+    except Exception as e:
+        await callback.message.answer(f"Ошибка: {e}")
+        await callback.answer()
 
 #ввод ID операции для удаления
-@dp.message(lambda message: message.text.isdigit())
-async def process_delete_operation(message: types.Message):
+@dp.message(DeleteStates.operation_id, text_input)
+async def process_delete_operation(message: types.Message, state: FSMContext):
+    if not message.text.isdigit():
+        await message.answer("Пожалуйста, введите числовой ID операции")
+        return
+    await state.clear()
     conn = get_db_connection()
     cur = conn.cursor()
     try:
         operation_id = int(message.text)
         chat_id = message.chat.id
         
-        #проверка на принадлежность операции пользователю
-        cur.execute("SELECT id FROM operations WHERE id = %s AND chat_id = %s", (operation_id, chat_id))
-        if not cur.fetchone():
+        #удаление только операции этого пользователя
+        cur.execute(
+            "DELETE FROM operations WHERE id = %s AND chat_id = %s RETURNING operation_type, amount",
+            (operation_id, chat_id)
+        )
+        deleted = cur.fetchone()
+        if not deleted:
             await message.answer("Операция с таким ID не найдена или не принадлежит вам")
             return
         
-        #удаление
-        cur.execute("DELETE FROM operations WHERE id = %s AND chat_id = %s", (operation_id, chat_id))
+        apply_balance_change(cur, chat_id, deleted[0], deleted[1], -1)
         conn.commit()
-        
-        if cur.rowcount > 0:
-            await message.answer(f"Операция {operation_id} успешно удалена")
-        else:
-            await message.answer("Не удалось удалить операцию")
+        await message.answer(f"Операция {operation_id} успешно удалена")
     except ValueError:
         await message.answer("Пожалуйста, введите числовой ID операции")
     except Exception as e:
@@ -280,7 +780,14 @@ async def process_delete_operation(message: types.Message):
 #запуска бота
 async def main():
     create_tables()
-    await dp.start_polling(bot)
+    run_migrations()
+    load_registered_users()
+    start_http_server(METRICS_PORT, registry=metrics_registry)
+    try:
+        await run_bot(dp, bot, default_webhook_port=8084)
+    finally:
+        if http_session:
+            await http_session.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
@@ -1,4 +1,13 @@
-from flask import Flask, jsonify, request
+import os
+import csv
+import math
+import time
+import hashlib
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timezone
+from flask import Flask, Response, g, jsonify, request
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
 
 app = Flask(__name__)
 
@@ -9,17 +18,134 @@ RATES = {
     "RUB": 1.0
 }
 
+#время кэширования ответа /rates клиентами, секунд
+RATES_MAX_AGE = int(os.getenv('RATES_MAX_AGE', '60'))
+
+#файл истории курсов: строки currency,date,rate
+RATES_HISTORY_PATH = os.getenv('RATES_HISTORY_PATH', 'rates_history.csv')
+
+#история курсов: валюта -> (отсортированные метки времени, курсы)
+RATES_HISTORY = {}
+
+#метрики в формате Prometheus
+metrics_registry = CollectorRegistry()
+REQUESTS = Counter('http_requests_total', 'Количество HTTP-запросов',
+                   ['route', 'method', 'status'], registry=metrics_registry)
+REQUEST_ERRORS = Counter('http_request_errors_total', 'Количество ответов с ошибкой сервера',
+                         ['route'], registry=metrics_registry)
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Время обработки запроса',
+                            ['route'], registry=metrics_registry)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unknown'
+    REQUEST_LATENCY.labels(route).observe(time.perf_counter() - g.request_started)
+    REQUESTS.labels(route, request.method, response.status_code).inc()
+    if response.status_code >= 500:
+        REQUEST_ERRORS.labels(route).inc()
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Метрики сервиса для Prometheus"""
+    return Response(generate_latest(metrics_registry), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+def parse_timestamp(value):
+    """Метка времени UTC из даты или даты-времени в формате ISO"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def load_rates_history(path):
+    """Загрузка истории в компактные массивы, упорядоченные по времени"""
+    points = {}
+    if os.path.exists(path):
+        with open(path, newline='', encoding='utf-8') as f:
+            for line, row in enumerate(csv.reader(f), start=1):
+                if len(row) < 3 or row[0] == 'currency':
+                    continue
+                #ошибочная строка пропускается, чтобы сервер все равно запустился
+                try:
+                    timestamp = parse_timestamp(row[1])
+                    rate = float(row[2])
+                except ValueError as e:
+                    app.logger.warning(f"{path}:{line}: строка пропущена ({e})")
+                    continue
+                if not math.isfinite(rate) or rate <= 0:
+                    app.logger.warning(f"{path}:{line}: строка пропущена (неверный курс {row[2]})")
+                    continue
+                points.setdefault(row[0].upper(), []).append((timestamp, rate))
+
+    history = {}
+    for currency, series in points.items():
+        series.sort()
+        history[currency] = (array('d', (p[0] for p in series)), array('d', (p[1] for p in series)))
+    return history
+
+def rate_at(currency, timestamp):
+    """Курс, действовавший на момент timestamp, или None"""
+    series = RATES_HISTORY.get(currency)
+    if series is None:
+        #для валют без истории курс не меняется
+        return RATES[currency]
+    timestamps, rates = series
+    position = bisect_right(timestamps, timestamp)
+    if position == 0:
+        return None
+    #начиная с последней точки истории действует текущий курс
+    if position == len(timestamps):
+        return RATES[currency]
+    return rates[position - 1]
+
 @app.route('/rate', methods=['GET'])
 def get_rate():
     currency = request.args.get('currency')
+    date = request.args.get('date')
     
     if currency not in RATES:
         return jsonify({"message": "UNKNOWN CURRENCY"}), 400
     
     try:
+        if date:
+            try:
+                timestamp = parse_timestamp(date)
+            except ValueError:
+                return jsonify({"message": "INVALID DATE"}), 400
+            rate = rate_at(currency, timestamp)
+            if rate is None:
+                return jsonify({"message": "NO RATE FOR DATE"}), 404
+            return jsonify({"rate": rate}), 200
         return jsonify({"rate": RATES[currency]}), 200
     except Exception as e:
         return jsonify({"message": "UNEXPECTED ERROR"}), 500
 
+@app.route('/rates', methods=['GET'])
+def get_rates():
+    #фильтр: ?currencies=USD,EUR или повторяющийся параметр currency
+    requested = request.args.getlist('currency')
+    for value in request.args.getlist('currencies'):
+        requested.extend(value.split(','))
+    requested = [currency.strip().upper() for currency in requested if currency.strip()]
+
+    if any(currency not in RATES for currency in requested):
+        return jsonify({"message": "UNKNOWN CURRENCY"}), 400
+    
+    try:
+        rates = {currency: RATES[currency] for currency in (requested or RATES)}
+        response = jsonify({"rates": rates})
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+        response.headers['Cache-Control'] = f'public, max-age={RATES_MAX_AGE}'
+        #ответ 304 при совпадении If-None-Match
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({"message": "UNEXPECTED ERROR"}), 500
+
+RATES_HISTORY = load_rates_history(RATES_HISTORY_PATH)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,51 @@
+from array import array
+from itertools import compress
+from math import fsum
+
+#пересчет истории операций сразу во все валюты
+#суммы хранятся в array('d'), умножение выполняется через map без цикла в Python
+
+def value_operations(amounts, is_income, rates):
+    """
+    amounts - суммы операций в рублях (array('d'))
+    is_income - признак дохода для каждой операции (bytes или список bool)
+    rates - курсы к рублю: {валюта: курс}
+    Возвращает итоги по валютам и суммы каждой операции во всех валютах.
+    """
+    #итоги считаются один раз в рублях и затем масштабируются
+    income_rub = fsum(compress(amounts, is_income))
+    expense_rub = fsum(amounts) - income_rub
+
+    totals = {}
+    values = {}
+    for currency, rate in rates.items():
+        inverse = 1 / rate
+        totals[currency] = {
+            'income': round(income_rub * inverse, 2),
+            'expense': round(expense_rub * inverse, 2),
+            'balance': round((income_rub - expense_rub) * inverse, 2),
+        }
+        values[currency] = array('d', map(inverse.__mul__, amounts))
+    return totals, values
+
+def value_operations_loop(amounts, is_income, rates):
+    """Поэлементный пересчет, как в show_operations, для сравнения в бенчмарке"""
+    totals = {}
+    values = {}
+    for currency, rate in rates.items():
+        income = expense = 0.0
+        converted = []
+        for amount, income_flag in zip(amounts, is_income):
+            value = round(amount / rate, 2)
+            converted.append(value)
+            if income_flag:
+                income += value
+            else:
+                expense += value
+        totals[currency] = {
+            'income': round(income, 2),
+            'expense': round(expense, 2),
+            'balance': round(income - expense, 2),
+        }
+        values[currency] = converted
+    return totals, values
@@ -0,0 +1,92 @@
+import os
+import time
+import asyncio
+import logging
+from aiogram import BaseMiddleware
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from prometheus_client import Counter, Histogram
+import query_stats
+
+#общие части ботов lab4.py, lab5.py, lab-6/lab6.py и RGZ/rgzbot.py
+
+#учет обновлений и времени работы каждого обработчика
+class MetricsMiddleware(BaseMiddleware):
+    def __init__(self, registry):
+        self.updates = Counter('bot_updates_total', 'Количество обработанных обновлений',
+                               ['handler'], registry=registry)
+        self.errors = Counter('bot_handler_errors_total', 'Количество ошибок в обработчиках',
+                              ['handler'], registry=registry)
+        self.latency = Histogram('bot_handler_duration_seconds', 'Время работы обработчика',
+                                 ['handler'], registry=registry)
+
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors.labels(name).inc()
+            raise
+        finally:
+            self.latency.labels(name).observe(time.perf_counter() - started)
+            self.updates.labels(name).inc()
+
+def setup_metrics(dp, registry):
+    """Метрики обработчиков сообщений и кнопок в registry бота"""
+    middleware = MetricsMiddleware(registry)
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+
+#учет запросов к базе данных в каждом обработчике
+class QueryStatsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        with query_stats.track(data['handler'].callback.__name__):
+            return await handler(event, data)
+
+def setup_query_stats(dp):
+    """Статистика запросов к базе данных по обработчикам бота"""
+    middleware = QueryStatsMiddleware()
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+
+#прием обновлений через локальный aiohttp-сервер
+#настройки читаются при запуске, после load_dotenv() в боте
+async def run_webhook(dp, bot, default_port):
+    #публичный адрес, который регистрируется в Telegram (без пути)
+    url = os.getenv('WEBHOOK_URL')
+    path = os.getenv('WEBHOOK_PATH', '/webhook')
+    secret = os.getenv('WEBHOOK_SECRET')
+    host = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    port = int(os.getenv('WEBHOOK_PORT', str(default_port)))
+    if not secret:
+        raise RuntimeError("Для режима webhook нужно задать WEBHOOK_SECRET")
+    app = web.Application()
+    #запросы без верного X-Telegram-Bot-Api-Secret-Token отклоняются,
+    #на остальные сразу отвечаем 200, обновление обрабатывается в фоне
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=secret
+    ).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+        if url:
+            await bot.set_webhook(url + path, secret_token=secret)
+        logging.info(f"Webhook слушает {host}:{port}{path}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+async def run_bot(dp, bot, default_webhook_port):
+    """Получение обновлений в режиме BOT_MODE: polling (по умолчанию) или webhook"""
+    if os.getenv('BOT_MODE', 'polling') == 'webhook':
+        await run_webhook(dp, bot, default_webhook_port)
+    else:
+        #webhook, оставшийся после режима webhook, не дает получать getUpdates
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import importlib.util
+from datetime import datetime
+from itertools import count
+
+#пропускная способность диспетчеров ботов без обращения к Telegram
+#пример: python dispatcher_benchmark.py --bots lab4,lab5 --iterations 500
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+#токен нужного формата, запросы к Telegram перехватываются
+os.environ.setdefault('API_TOKEN', '123456:benchmark-token')
+#журнал lab4 пишется во временный каталог
+os.environ.setdefault('CURRENCY_DATA_DIR', tempfile.mkdtemp(prefix='lab4-bench-'))
+
+import query_stats
+from aiogram import BaseMiddleware
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage, EditMessageText
+from aiogram.types import Update, Message, CallbackQuery, Chat, User
+
+#сессия бота, которая только запоминает исходящие вызовы
+class FakeSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.calls = {}
+        self.message_ids = count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        name = type(method).__name__
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if isinstance(method, (SendMessage, EditMessageText)):
+            return Message(
+                message_id=next(self.message_ids),
+                date=datetime.now(),
+                chat=Chat(id=int(method.chat_id or 0), type='private'),
+                text=method.text
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        #скачивание файлов в сценариях не используется, вызов только учитывается
+        self.calls['stream_content'] = self.calls.get('stream_content', 0) + 1
+        return
+        yield
+
+    async def close(self):
+        pass
+
+#время работы каждого обработчика
+class HandlerTimer(BaseMiddleware):
+    def __init__(self):
+        self.latencies = {}
+
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+
+#сценарии: ('text', текст) или ('callback', данные кнопки)
+FLOWS = {
+    'lab4': [
+        ('text', '/start'),
+        ('text', '/save_currency'), ('text', 'USD'), ('text', '90.5'),
+        ('text', '/convert'), ('text', '1'), ('text', '100'),
+        ('text', '/list'),
+    ],
+    'lab5': [
+        ('text', '/start'),
+        ('text', '/get_currencies'),
+        ('text', '/convert'), ('text', 'USD'), ('text', '100'),
+    ],
+    'lab6': [
+        ('text', '/start'),
+        ('text', '/get_currencies'),
+        ('text', '/convert'), ('text', 'USD'), ('text', '100'),
+    ],
+    'rgzbot': [
+        ('text', '/start'),
+        ('text', '/add_operation'), ('callback', 'income'), ('text', '1500'), ('text', '2024-01-01'),
+        ('text', '/balance'),
+        ('text', '/operations'), ('callback', 'currency_RUB'),
+    ],
+}
+
+BOT_FILES = {
+    'lab4': 'lab4.py',
+    'lab5': 'lab5.py',
+    'lab6': os.path.join('lab-6', 'lab6.py'),
+    'rgzbot': os.path.join('RGZ', 'rgzbot.py'),
+}
+
+def load_bot_module(name):
+    path = os.path.join(ROOT, BOT_FILES[name])
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(f'bench_{name}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+async def prepare_bot(name, module):
+    """Та же подготовка, что в main() каждого бота"""
+    try:
+        if name == 'lab4':
+            module.load_currency()
+            module.rebuild_list_pages()
+        elif name == 'lab5':
+            module.create_db_pool()
+            await module.init_db()
+            await module.load_admins()
+        elif name == 'lab6':
+            module.init_db()
+        elif name == 'rgzbot':
+            module.create_tables()
+            module.run_migrations()
+            module.load_registered_users()
+    except Exception as e:
+        print(f"{name}: подготовка без базы данных ({e})")
+
+def make_update(update_id, user_id, kind, value):
+    user = User(id=user_id, is_bot=False, first_name='Bench')
+    chat = Chat(id=user_id, type='private')
+    if kind == 'text':
+        message = Message(message_id=update_id, date=datetime.now(), chat=chat, from_user=user, text=value)
+        return Update(update_id=update_id, message=message)
+    message = Message(message_id=update_id, date=datetime.now(), chat=chat, text='menu')
+    callback = CallbackQuery(id=str(update_id), from_user=user, chat_instance='bench', data=value, message=message)
+    return Update(update_id=update_id, callback_query=callback)
+
+async def run_bot(name, iterations):
+    module = load_bot_module(name)
+    session = FakeSession()
+    module.bot.session = session
+    await prepare_bot(name, module)
+
+    timer = HandlerTimer()
+    module.dp.message.middleware(timer)
+    module.dp.callback_query.middleware(timer)
+
+    flow = FLOWS[name]
+    updates = [
+        make_update(i * len(flow) + step, 100000 + i, kind, value)
+        for i in range(iterations)
+        for step, (kind, value) in enumerate(flow)
+    ]
+    if name == 'rgzbot':
+        module.registered_chats.update(100000 + i for i in range(iterations))
+
+    #боты считают запросы через общий модуль query_stats
+    queries_before = query_stats.totals["queries"]
+    errors = 0
+    started = time.perf_counter()
+    for update in updates:
+        try:
+            await module.dp.feed_update(module.bot, update)
+        except Exception:
+            #необработанные ошибки обработчиков (например, нет базы данных)
+            errors += 1
+    elapsed = time.perf_counter() - started
+    queries = query_stats.totals["queries"] - queries_before
+
+    #ресурсы, которые боты закрывают при остановке
+    if getattr(module, 'http_session', None):
+        await module.http_session.close()
+    if getattr(module, 'db_pool', None):
+        module.db_pool.closeall()
+
+    handlers = {}
+    for handler, values in timer.latencies.items():
+        values.sort()
+        handlers[handler] = {
+            'calls': len(values),
+            'mean_ms': sum(values) / len(values) * 1000,
+            'p95_ms': values[min(len(values) - 1, int(len(values) * 0.95))] * 1000,
+        }
+    return {
+        'updates': len(updates),
+        'errors': errors,
+        'updates_per_sec': len(updates) / elapsed if elapsed else 0.0,
+        'db_queries_per_update': queries / len(updates),
+        'bot_calls_per_update': sum(session.calls.values()) / len(updates),
+        'bot_calls': session.calls,
+        'handlers': handlers,
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description='Пропускная способность диспетчеров ботов')
+    parser.add_argument('--bots', default='lab4,lab5,lab6,rgzbot')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', default=None, help='файл для результатов в JSON')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.bots.split(','):
+        result = await run_bot(name, args.iterations)
+        results[name] = result
+        print(f"\n{name}: {result['updates']} обновлений ({result['errors']} с ошибкой), "
+              f"{result['updates_per_sec']:.1f} обн/с, "
+              f"запросов к БД на обновление {result['db_queries_per_update']:.2f}, "
+              f"вызовов API на обновление {result['bot_calls_per_update']:.2f}")
+        print(f"  {'обработчик':<28} {'вызовов':>8} {'среднее, мс':>12} {'p95, мс':>9}")
+        for handler, stats in result['handlers'].items():
+            print(f"  {handler:<28} {stats['calls']:>8} {stats['mean_ms']:>12.3f} {stats['p95_ms']:>9.3f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    asyncio.run(main())
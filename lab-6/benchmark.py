@@ -0,0 +1,72 @@
+import time
+import asyncio
+import argparse
+import aiohttp
+
+#сравнение производительности Flask и асинхронной версии data_manager
+#асинхронную версию запустить на другом порту: DATA_MANAGER_PORT=5003 python data_manager_async.py
+#пример: python benchmark.py --flask-url http://localhost:5002 --async-url http://localhost:5003
+
+def percentile(values, p):
+    """Перцентиль по отсортированному списку"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+async def run_load(base_url, path, total, concurrency):
+    """Отправка total запросов с заданным числом одновременных клиентов"""
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def worker():
+            nonlocal errors
+            for _ in counter:
+                started = time.perf_counter()
+                try:
+                    async with session.get(base_url + path) as response:
+                        await response.read()
+                        if response.status >= 500:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'errors': errors,
+        'rps': total / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description='Нагрузочное сравнение data_manager')
+    parser.add_argument('--flask-url', default='http://localhost:5002')
+    parser.add_argument('--async-url', default='http://localhost:5003')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--currency', default='USD')
+    args = parser.parse_args()
+
+    paths = [f'/convert?currency={args.currency}&amount=100', '/currencies']
+    targets = [('flask', args.flask_url), ('async', args.async_url)]
+
+    print(f"{'сервис':<8} {'маршрут':<12} {'запр/с':>10} {'p50, мс':>10} {'p99, мс':>10} {'ошибки':>8}")
+    for name, url in targets:
+        for path in paths:
+            stats = await run_load(url, path, args.requests, args.concurrency)
+            route = path.split('?')[0]
+            print(f"{name:<8} {route:<12} {stats['rps']:>10.1f} {stats['p50_ms']:>10.2f} "
+                  f"{stats['p99_ms']:>10.2f} {stats['errors']:>8}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from load_test import TEST_PREFIX, CURRENCY_MANAGER_URL, check_database, prepare_database, start_services
+
+#проверка атомарности /load, /update_currency и /delete в currency_maneger.py
+#много потоков одновременно отправляют запрос для одной и той же валюты
+#пример: LOAD_TEST_DB_NAME=currency_load_test python concurrency_check.py --threads 50
+
+def post(path, body):
+    """POST с JSON, возвращает код ответа"""
+    request = urllib.request.Request(
+        CURRENCY_MANAGER_URL + path,
+        data=json.dumps(body).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def wait_for_service(timeout=15):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            post('/delete', {})
+            return
+        except urllib.error.URLError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Сервис {CURRENCY_MANAGER_URL} не запустился")
+            time.sleep(0.2)
+
+def hammer(path, bodies):
+    """Одновременная отправка запросов: все потоки стартуют по барьеру"""
+    barrier = threading.Barrier(len(bodies))
+
+    def send(body):
+        barrier.wait()
+        return post(path, body)
+
+    with ThreadPoolExecutor(max_workers=len(bodies)) as pool:
+        statuses = list(pool.map(send, bodies))
+    counts = {}
+    for status in statuses:
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+def check(title, counts, expected):
+    ok = counts == expected
+    print(f"{'OK  ' if ok else 'FAIL'} {title}: получено {counts}, ожидалось {expected}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='Параллельные запросы к одной валюте')
+    parser.add_argument('--threads', type=int, default=50)
+    parser.add_argument('--no-start', action='store_true',
+                        help='сервис уже запущен с DB_NAME, равным LOAD_TEST_DB_NAME')
+    args = parser.parse_args()
+    n = args.threads
+
+    check_database()
+    prepare_database()
+    processes = [] if args.no_start else start_services()
+    results = []
+    try:
+        wait_for_service()
+        #новое имя при каждом запуске, чтобы проверять именно гонку вставки
+        name = f"{TEST_PREFIX}RACE_{os.getpid()}"
+
+        counts = hammer('/load', [{'currency_name': name, 'rate': 10 + i} for i in range(n)])
+        results.append(check(f"/load {n} x {name}", counts, {200: 1, 409: n - 1}))
+
+        counts = hammer('/update_currency', [{'currency_name': name, 'rate': 20 + i} for i in range(n)])
+        results.append(check(f"/update_currency {n} x {name}", counts, {200: n}))
+
+        counts = hammer('/delete', [{'currency_name': name}] * n)
+        results.append(check(f"/delete {n} x {name}", counts, {200: 1, 404: n - 1}))
+
+        counts = hammer('/update_currency', [{'currency_name': name, 'rate': 1}] * n)
+        results.append(check(f"/update_currency удаленной {name}", counts, {404: n}))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,16 @@
 import os
+import sys
+import io
+import math
+import time
+import csv
 import psycopg2
-from flask import Flask, request, jsonify
+from psycopg2.extras import execute_values
+from flask import Flask, Response, g, request, jsonify
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+#общий модуль учета запросов лежит в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import query_stats
 from dotenv import load_dotenv
 
 #загрузка переменных окружения
@@ -15,17 +25,60 @@ DB_PASSWORD = os.getenv('DB_PASSWORD', 'postgres')
 DB_HOST = os.getenv('DB_HOST', 'localhost')
 DB_PORT = os.getenv('DB_PORT', '5432')
 
+#метрики в формате Prometheus
+metrics_registry = CollectorRegistry()
+REQUESTS = Counter('http_requests_total', 'Количество HTTP-запросов',
+                   ['route', 'method', 'status'], registry=metrics_registry)
+REQUEST_ERRORS = Counter('http_request_errors_total', 'Количество ответов с ошибкой сервера',
+                         ['route'], registry=metrics_registry)
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Время обработки запроса',
+                            ['route'], registry=metrics_registry)
+DB_CONNECTIONS = Counter('db_connections_total', 'Количество открытых соединений с базой данных',
+                         registry=metrics_registry)
+DB_CONNECTION_ERRORS = Counter('db_connection_errors_total', 'Количество ошибок подключения к базе данных',
+                               registry=metrics_registry)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    route = request.url_rule.rule if request.url_rule else 'unknown'
+    g.query_stats_token = query_stats.start(f"{request.method} {route}")
+
+@app.teardown_request
+def finish_query_stats(exc):
+    token = g.pop('query_stats_token', None)
+    if token is not None:
+        query_stats.finish(token)
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unknown'
+    REQUEST_LATENCY.labels(route).observe(time.perf_counter() - g.request_started)
+    REQUESTS.labels(route, request.method, response.status_code).inc()
+    if response.status_code >= 500:
+        REQUEST_ERRORS.labels(route).inc()
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Метрики сервиса для Prometheus"""
+    return Response(generate_latest(metrics_registry), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
 def get_db_connection():
     """Установка соединения с базой данных"""
     try:
-        return psycopg2.connect(
+        conn = psycopg2.connect(
             dbname=DB_NAME,
             user=DB_USER,
             password=DB_PASSWORD,
             host=DB_HOST,
-            port=DB_PORT
+            port=DB_PORT,
+            cursor_factory=query_stats.TracingCursor
         )
+        DB_CONNECTIONS.inc()
+        return conn
     except Exception as e:
+        DB_CONNECTION_ERRORS.inc()
         app.logger.error(f"Ошибка подключения к базе данных: {e}")
         return None
 
@@ -57,17 +110,19 @@ def load_currency():
             return jsonify({'error': 'Не удалось подключиться к базе данных'}), 500
 
         with conn.cursor() as cur:
-            #проверка существования валюты
-            cur.execute("SELECT 1 FROM currencies WHERE currency_name = %s", (currency_name.upper(),))
-            if cur.fetchone():
-                return jsonify({'error': 'Валюта уже существует'}), 400
-
-            #добавление валюты
+            #добавление валюты, существующая валюта не изменяется
             cur.execute(
-                "INSERT INTO currencies (currency_name, rate) VALUES (%s, %s)",
+                """
+                INSERT INTO currencies (currency_name, rate) VALUES (%s, %s)
+                ON CONFLICT (currency_name) DO NOTHING
+                RETURNING id
+                """,
                 (currency_name.upper(), rate)
             )
+            added = cur.fetchone()
             conn.commit()
+            if not added:
+                return jsonify({'error': 'Валюта уже существует'}), 409
             return jsonify({'message': f'Валюта {currency_name} успешно добавлена'}), 200
 
     except Exception as e:
@@ -77,6 +132,104 @@ def load_currency():
         if conn:
             conn.close()
 
+#ограничения столбцов currencies: VARCHAR(50) и NUMERIC(10, 2)
+MAX_CURRENCY_NAME_LENGTH = 50
+MAX_RATE = 10 ** 8
+
+def parse_bulk_rows():
+    """Строки (название, курс) из JSON-массива или CSV"""
+    if request.mimetype == 'text/csv':
+        text = request.get_data(as_text=True)
+        rows = []
+        for row in csv.reader(io.StringIO(text)):
+            if not row or not ''.join(row).strip():
+                continue
+            rows.append({'currency_name': row[0].strip(), 'rate': row[1].strip() if len(row) > 1 else None})
+        #строка заголовка не является данными
+        if rows and rows[0]['currency_name'].lower() == 'currency_name':
+            rows = rows[1:]
+        return rows
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        return None
+    return data
+
+@app.route('/load/bulk', methods=['POST'])
+def load_currency_bulk():
+    """Массовое добавление и обновление валют"""
+    rows = parse_bulk_rows()
+    if rows is None:
+        return jsonify({'error': 'Необходимо передать массив JSON или CSV'}), 400
+
+    #проверка строк, повторная валюта перезаписывает предыдущую
+    valid = {}
+    rejected = []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict) or not row.get('currency_name') or not row.get('rate'):
+            rejected.append({'row': i, 'error': 'Не указано название валюты или курс'})
+            continue
+        try:
+            rate = float(row['rate'])
+        except (TypeError, ValueError):
+            rejected.append({'row': i, 'error': 'Неверный формат курса. Должно быть число'})
+            continue
+        if not math.isfinite(rate) or rate <= 0:
+            rejected.append({'row': i, 'error': 'Курс должен быть положительным числом'})
+            continue
+        #значение округляется до двух знаков при записи в NUMERIC(10, 2)
+        if round(rate, 2) >= MAX_RATE:
+            rejected.append({'row': i, 'error': f'Курс должен быть меньше {MAX_RATE}'})
+            continue
+        name = str(row['currency_name']).upper()
+        if len(name) > MAX_CURRENCY_NAME_LENGTH:
+            rejected.append({'row': i, 'error': f'Название валюты длиннее {MAX_CURRENCY_NAME_LENGTH} символов'})
+            continue
+        valid[name] = rate
+
+    inserted = updated = 0
+    if valid:
+        conn = None
+        try:
+            conn = get_db_connection()
+            if not conn:
+                return jsonify({'error': 'Не удалось подключиться к базе данных'}), 500
+
+            with conn.cursor() as cur:
+                #одна вставка на все строки, xmax = 0 только у новых записей;
+                #строки идут по названию, чтобы параллельные загрузки блокировали их
+                #в одном порядке и не попадали во взаимоблокировку
+                result = execute_values(
+                    cur,
+                    """
+                    INSERT INTO currencies (currency_name, rate) VALUES %s
+                    ON CONFLICT (currency_name) DO UPDATE SET rate = EXCLUDED.rate
+                    RETURNING (xmax = 0)
+                    """,
+                    sorted(valid.items()),
+                    page_size=len(valid),
+                    fetch=True
+                )
+                conn.commit()
+                inserted = sum(1 for row in result if row[0])
+                updated = len(result) - inserted
+
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            app.logger.error(f"Ошибка при массовой загрузке валют: {e}")
+            return jsonify({'error': 'Внутренняя ошибка сервера'}), 500
+        finally:
+            if conn:
+                conn.close()
+
+    return jsonify({
+        'inserted': inserted,
+        'updated': updated,
+        'rejected': len(rejected),
+        'errors': rejected
+    }), 200
+
 @app.route('/update_currency', methods=['POST'])
 def update_currency():
     """Обновление курса валюты"""
@@ -105,17 +258,15 @@ def update_currency():
             return jsonify({'error': 'Не удалось подключиться к базе данных'}), 500
 
         with conn.cursor() as cur:
-            #проверка существования валюты
-            cur.execute("SELECT 1 FROM currencies WHERE currency_name = %s", (currency_name.upper(),))
-            if not cur.fetchone():
-                return jsonify({'error': 'Валюта не найдена'}), 404
-
             #обновление курса
             cur.execute(
-                "UPDATE currencies SET rate = %s WHERE currency_name = %s",
+                "UPDATE currencies SET rate = %s WHERE currency_name = %s RETURNING id",
                 (new_rate, currency_name.upper())
             )
+            updated = cur.fetchone()
             conn.commit()
+            if not updated:
+                return jsonify({'error': 'Валюта не найдена'}), 404
             return jsonify({'message': f'Курс валюты {currency_name} обновлен до {new_rate}'}), 200
 
     except Exception as e:
@@ -143,14 +294,15 @@ def delete_currency():
             return jsonify({'error': 'Не удалось подключиться к базе данных'}), 500
 
         with conn.cursor() as cur:
-            #проверка существования валюты
-            cur.execute("SELECT 1 FROM currencies WHERE currency_name = %s", (currency_name.upper(),))
-            if not cur.fetchone():
-                return jsonify({'error': 'Валюта не найдена'}), 404
-
             #удаление валюты
-            cur.execute("DELETE FROM currencies WHERE currency_name = %s", (currency_name.upper(),))
+            cur.execute(
+                "DELETE FROM currencies WHERE currency_name = %s RETURNING id",
+                (currency_name.upper(),)
+            )
+            deleted = cur.fetchone()
             conn.commit()
+            if not deleted:
+                return jsonify({'error': 'Валюта не найдена'}), 404
             return jsonify({'message': f'Валюта {currency_name} успешно удалена'}), 200
 
     except Exception as e:
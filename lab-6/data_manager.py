@@ -1,6 +1,18 @@
 import os
+import sys
+import math
+import time
+import select
+import hashlib
+import threading
 import psycopg2
-from flask import Flask, request, jsonify
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from flask import Flask, Response, g, request, jsonify
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+#общий модуль учета запросов лежит в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import query_stats
+from schema import create_currencies_schema
 from dotenv import load_dotenv
 
 #загрузка переменных окружения
@@ -15,23 +27,86 @@ DB_PASSWORD = os.getenv('DB_PASSWORD', 'postgres')
 DB_HOST = os.getenv('DB_HOST', 'localhost')
 DB_PORT = os.getenv('DB_PORT', '5432')
 
+#максимальный размер пакета для /convert/batch
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '100000'))
+
+#отслеживание изменений таблицы currencies
+LISTEN_POLL_INTERVAL = float(os.getenv('LISTEN_POLL_INTERVAL', '5'))
+LISTEN_RETRY_INTERVAL = float(os.getenv('LISTEN_RETRY_INTERVAL', '5'))
+
+#снимок ответа /currencies: (версия, тело, ETag, индексы валют, матрица кросс-курсов)
+currencies_snapshot = None
+currencies_version = 0
+currencies_listener = None
+currencies_listener_ok = False
+currencies_lock = threading.Lock()
+
+#метрики в формате Prometheus
+metrics_registry = CollectorRegistry()
+REQUESTS = Counter('http_requests_total', 'Количество HTTP-запросов',
+                   ['route', 'method', 'status'], registry=metrics_registry)
+REQUEST_ERRORS = Counter('http_request_errors_total', 'Количество ответов с ошибкой сервера',
+                         ['route'], registry=metrics_registry)
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Время обработки запроса',
+                            ['route'], registry=metrics_registry)
+DB_CONNECTIONS = Counter('db_connections_total', 'Количество открытых соединений с базой данных',
+                         registry=metrics_registry)
+DB_CONNECTION_ERRORS = Counter('db_connection_errors_total', 'Количество ошибок подключения к базе данных',
+                               registry=metrics_registry)
+LISTENER_UP = Gauge('currencies_listener_up', 'Работает ли отслеживание изменений валют',
+                    registry=metrics_registry)
+LISTENER_UP.set_function(lambda: 1 if currencies_listener_ok else 0)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    route = request.url_rule.rule if request.url_rule else 'unknown'
+    g.query_stats_token = query_stats.start(f"{request.method} {route}")
+
+@app.teardown_request
+def finish_query_stats(exc):
+    token = g.pop('query_stats_token', None)
+    if token is not None:
+        query_stats.finish(token)
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unknown'
+    REQUEST_LATENCY.labels(route).observe(time.perf_counter() - g.request_started)
+    REQUESTS.labels(route, request.method, response.status_code).inc()
+    if response.status_code >= 500:
+        REQUEST_ERRORS.labels(route).inc()
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Метрики сервиса для Prometheus"""
+    return Response(generate_latest(metrics_registry), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
 def get_db_connection():
     """Установка соединения с базой данных"""
     try:
-        return psycopg2.connect(
+        conn = psycopg2.connect(
             dbname=DB_NAME,
             user=DB_USER,
             password=DB_PASSWORD,
             host=DB_HOST,
-            port=DB_PORT
+            port=DB_PORT,
+            cursor_factory=query_stats.TracingCursor
         )
+        DB_CONNECTIONS.inc()
+        return conn
     except Exception as e:
+        DB_CONNECTION_ERRORS.inc()
         app.logger.error(f"Ошибка подключения к базе данных: {e}")
         return None
 
 @app.route('/convert', methods=['GET'])
 def convert_currency():
     """Конвертация валюты"""
+    if request.args.get('from') or request.args.get('to'):
+        return convert_currency_pair()
+
     currency_name = request.args.get('currency')
     amount = request.args.get('amount')
 
@@ -41,7 +116,7 @@ def convert_currency():
     try:
         #проверка что сумма является числом
         amount = float(amount)
-        if amount <= 0:
+        if not math.isfinite(amount) or amount <= 0:
             return jsonify({'error': 'Сумма должна быть положительным числом'}), 400
     except ValueError:
         return jsonify({'error': 'Неверный формат суммы. Должно быть число'}), 400
@@ -63,7 +138,7 @@ def convert_currency():
             if not result:
                 return jsonify({'error': 'Валюта не найдена'}), 404
 
-            rate = result[0]
+            rate = float(result[0])
             converted_amount = amount * rate
             return jsonify({
                 'currency': currency_name.upper(),
@@ -79,32 +154,234 @@ def convert_currency():
         if conn:
             conn.close()
 
-@app.route('/currencies', methods=['GET'])
-def get_all_currencies():
-    """Получение списка всех валют"""
-    conn = None
+def convert_currency_pair():
+    """Конвертация между любыми двумя валютами по матрице кросс-курсов"""
+    from_name = request.args.get('from')
+    to_name = request.args.get('to')
+    amount = request.args.get('amount')
+
+    if not from_name or not to_name or not amount:
+        return jsonify({'error': 'Не указаны валюты или сумма'}), 400
+
     try:
-        conn = get_db_connection()
-        if not conn:
+        #проверка что сумма является числом
+        amount = float(amount)
+        if not math.isfinite(amount) or amount <= 0:
+            return jsonify({'error': 'Сумма должна быть положительным числом'}), 400
+    except ValueError:
+        return jsonify({'error': 'Неверный формат суммы. Должно быть число'}), 400
+
+    try:
+        snapshot = get_currencies_snapshot()
+        if not snapshot:
             return jsonify({'error': 'Не удалось подключиться к базе данных'}), 500
 
+        cross_index, cross = snapshot[3], snapshot[4]
+        i = cross_index.get(from_name.upper())
+        j = cross_index.get(to_name.upper())
+        if i is None or j is None:
+            return jsonify({'error': 'Валюта не найдена'}), 404
+
+        rate = cross[i][j]
+        if rate is None:
+            return jsonify({'error': 'Курс одной из валют равен нулю, конвертация невозможна'}), 422
+        return jsonify({
+            'from': from_name.upper(),
+            'to': to_name.upper(),
+            'original_amount': amount,
+            'converted_amount': round(amount * rate, 2),
+            'rate': rate
+        }), 200
+
+    except Exception as e:
+        app.logger.error(f"Ошибка при конвертации валюты: {e}")
+        return jsonify({'error': 'Внутренняя ошибка сервера'}), 500
+
+@app.route('/convert/batch', methods=['POST'])
+def convert_currency_batch():
+    """Пакетная конвертация списка сумм"""
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        return jsonify({'error': 'Необходимо передать массив JSON'}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Слишком много элементов, максимум {MAX_BATCH_SIZE}'}), 400
+
+    #проверка элементов, ошибки сохраняются по позициям
+    errors = [None] * len(items)
+    names = [None] * len(items)
+    amounts = [0.0] * len(items)
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('currency') or item.get('amount') is None:
+            errors[i] = 'Не указана валюта или сумма'
+            continue
+        try:
+            amount = float(item['amount'])
+        except (TypeError, ValueError):
+            errors[i] = 'Неверный формат суммы. Должно быть число'
+            continue
+        if not math.isfinite(amount) or amount <= 0:
+            errors[i] = 'Сумма должна быть положительным числом'
+            continue
+        names[i] = str(item['currency']).upper()
+        amounts[i] = amount
+
+    requested = {name for name in names if name}
+    rates = {}
+    if requested:
+        conn = None
+        try:
+            conn = get_db_connection()
+            if not conn:
+                return jsonify({'error': 'Не удалось подключиться к базе данных'}), 500
+
+            with conn.cursor() as cur:
+                #все нужные курсы одним запросом
+                cur.execute(
+                    "SELECT currency_name, rate FROM currencies WHERE currency_name = ANY(%s)",
+                    (list(requested),)
+                )
+                rates = {name: float(rate) for name, rate in cur.fetchall()}
+
+        except Exception as e:
+            app.logger.error(f"Ошибка при пакетной конвертации валюты: {e}")
+            return jsonify({'error': 'Внутренняя ошибка сервера'}), 500
+        finally:
+            if conn:
+                conn.close()
+
+    #расчет всех сумм за один проход
+    item_rates = [rates.get(name) for name in names]
+    converted = [round(amount * rate, 2) if rate is not None else None
+                 for amount, rate in zip(amounts, item_rates)]
+
+    results = []
+    for i, name in enumerate(names):
+        if errors[i]:
+            results.append({'error': errors[i]})
+        elif item_rates[i] is None:
+            results.append({'currency': name, 'error': 'Валюта не найдена'})
+        else:
+            results.append({
+                'currency': name,
+                'original_amount': amounts[i],
+                'converted_amount': converted[i],
+                'rate': item_rates[i]
+            })
+
+    return jsonify({'results': results}), 200
+
+def currencies_trigger_exists(cur):
+    """Есть ли триггер уведомлений об изменениях таблицы currencies"""
+    cur.execute(
+        "SELECT 1 FROM pg_trigger WHERE tgname = 'currencies_changed' AND tgrelid = 'currencies'::regclass"
+    )
+    return cur.fetchone() is not None
+
+def listen_currencies_changes():
+    """Фоновое отслеживание изменений таблицы currencies через LISTEN/NOTIFY"""
+    global currencies_version, currencies_listener_ok
+    while True:
+        conn = get_db_connection()
+        if conn:
+            try:
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    trigger_ready = currencies_trigger_exists(cur)
+                #триггер создается один раз при первом подключении, если init_db еще не запускали
+                if not trigger_ready:
+                    create_currencies_schema(conn)
+                    app.logger.info("Создан триггер currencies_changed")
+                with conn.cursor() as cur:
+                    cur.execute("LISTEN currencies_changed")
+                #изменения до подписки могли быть пропущены
+                with currencies_lock:
+                    currencies_version += 1
+                    currencies_listener_ok = True
+
+                while True:
+                    select.select([conn], [], [], LISTEN_POLL_INTERVAL)
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        with currencies_lock:
+                            currencies_version += 1
+            except Exception as e:
+                app.logger.error(f"Ошибка отслеживания изменений валют: {e}")
+            finally:
+                with currencies_lock:
+                    currencies_listener_ok = False
+                conn.close()
+        time.sleep(LISTEN_RETRY_INTERVAL)
+
+def start_currencies_listener():
+    """Однократный запуск фонового слушателя"""
+    global currencies_listener
+    with currencies_lock:
+        if currencies_listener is None:
+            currencies_listener = threading.Thread(target=listen_currencies_changes, daemon=True)
+            currencies_listener.start()
+
+def get_currencies_snapshot():
+    """Готовый JSON списка валют, перестраивается только после изменений"""
+    global currencies_snapshot
+    start_currencies_listener()
+    with currencies_lock:
+        snapshot = currencies_snapshot
+        #без слушателя снимку нельзя доверять
+        if snapshot and currencies_listener_ok and snapshot[0] == currencies_version:
+            return snapshot
+        version = currencies_version
+
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
         with conn.cursor() as cur:
             cur.execute("SELECT currency_name, rate FROM currencies ORDER BY currency_name")
             currencies = cur.fetchall()
-            
-            result = [{
-                'currency_name': currency[0],
-                'rate': float(currency[1])
-            } for currency in currencies]
-            
-            return jsonify({'currencies': result}), 200
+    finally:
+        conn.close()
+
+    result = [{
+        'currency_name': currency[0],
+        'rate': float(currency[1])
+    } for currency in currencies]
+    body = app.json.dumps({'currencies': result})
+    etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+    #матрица кросс-курсов: cross[i][j] - сколько единиц j стоит одна единица i
+    #курс меньше 0.005 хранится в NUMERIC(10, 2) как 0, такие пары отмечаются None
+    rub_rates = {item['currency_name']: item['rate'] for item in result}
+    rub_rates.setdefault('RUB', 1.0)
+    cross_index = {name: i for i, name in enumerate(rub_rates)}
+    values = list(rub_rates.values())
+    cross = [
+        [rate_from / rate_to if rate_from > 0 and rate_to > 0 else None for rate_to in values]
+        for rate_from in values
+    ]
+
+    snapshot = (version, body, etag, cross_index, cross)
+    with currencies_lock:
+        currencies_snapshot = snapshot
+    return snapshot
+
+@app.route('/currencies', methods=['GET'])
+def get_all_currencies():
+    """Получение списка всех валют"""
+    try:
+        snapshot = get_currencies_snapshot()
+        if not snapshot:
+            return jsonify({'error': 'Не удалось подключиться к базе данных'}), 500
+
+        response = app.response_class(snapshot[1], mimetype='application/json')
+        response.set_etag(snapshot[2])
+        response.headers['Cache-Control'] = 'no-cache'
+        #ответ 304 при совпадении If-None-Match
+        return response.make_conditional(request)
 
     except Exception as e:
         app.logger.error(f"Ошибка при получении списка валют: {e}")
         return jsonify({'error': 'Внутренняя ошибка сервера'}), 500
-    finally:
-        if conn:
-            conn.close()
 
 if __name__ == '__main__':
     app.run(port=5002)
\ No newline at end of file
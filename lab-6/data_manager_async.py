@@ -0,0 +1,261 @@
+import os
+import sys
+import math
+import asyncio
+import hashlib
+import logging
+import asyncpg
+from aiohttp import web
+from dotenv import load_dotenv
+#общий модуль учета запросов лежит в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import query_stats
+from schema import CURRENCIES_SCHEMA
+
+#загрузка переменных окружения
+load_dotenv()
+
+#настройка логирования
+logging.basicConfig(level=logging.INFO)
+
+#настройки базы данных
+DB_NAME = os.getenv('DB_NAME', 'currency_db')
+DB_USER = os.getenv('DB_USER', 'postgres')
+DB_PASSWORD = os.getenv('DB_PASSWORD', 'postgres')
+DB_HOST = os.getenv('DB_HOST', 'localhost')
+DB_PORT = os.getenv('DB_PORT', '5432')
+
+#настройки пула соединений
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '2'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '20'))
+
+#ограничение времени запроса
+DB_QUERY_TIMEOUT = float(os.getenv('DB_QUERY_TIMEOUT', '5'))
+
+#порт асинхронного сервиса
+PORT = int(os.getenv('DATA_MANAGER_PORT', '5002'))
+
+#пауза перед переподключением слушателя изменений валют
+LISTEN_RETRY_INTERVAL = float(os.getenv('LISTEN_RETRY_INTERVAL', '5'))
+
+routes = web.RouteTableDef()
+
+def error_response(message, status):
+    return web.json_response({'error': message}, status=status)
+
+@routes.get('/convert')
+async def convert_currency(request):
+    """Конвертация валюты"""
+    if request.query.get('from') or request.query.get('to'):
+        return await convert_currency_pair(request)
+
+    currency_name = request.query.get('currency')
+    amount = request.query.get('amount')
+
+    if not currency_name or not amount:
+        return error_response('Не указана валюта или сумма', 400)
+
+    try:
+        #проверка что сумма является числом
+        amount = float(amount)
+        if not math.isfinite(amount) or amount <= 0:
+            return error_response('Сумма должна быть положительным числом', 400)
+    except ValueError:
+        return error_response('Неверный формат суммы. Должно быть число', 400)
+
+    try:
+        #получение курса валюты
+        query = "SELECT rate FROM currencies WHERE currency_name = $1"
+        with query_stats.timed(query, (currency_name,)):
+            rate = await request.app['db_pool'].fetchval(query, currency_name.upper(), timeout=DB_QUERY_TIMEOUT)
+        if rate is None:
+            return error_response('Валюта не найдена', 404)
+
+        rate = float(rate)
+        return web.json_response({
+            'currency': currency_name.upper(),
+            'original_amount': amount,
+            'converted_amount': round(amount * rate, 2),
+            'rate': rate
+        })
+
+    except Exception as e:
+        logging.error(f"Ошибка при конвертации валюты: {e}")
+        return error_response('Внутренняя ошибка сервера', 500)
+
+async def convert_currency_pair(request):
+    """Конвертация между любыми двумя валютами по матрице кросс-курсов, как в data_manager.py"""
+    from_name = request.query.get('from')
+    to_name = request.query.get('to')
+    amount = request.query.get('amount')
+
+    if not from_name or not to_name or not amount:
+        return error_response('Не указаны валюты или сумма', 400)
+
+    try:
+        #проверка что сумма является числом
+        amount = float(amount)
+        if not math.isfinite(amount) or amount <= 0:
+            return error_response('Сумма должна быть положительным числом', 400)
+    except ValueError:
+        return error_response('Неверный формат суммы. Должно быть число', 400)
+
+    try:
+        cross_index, cross = await get_cross_rates(request.app)
+        i = cross_index.get(from_name.upper())
+        j = cross_index.get(to_name.upper())
+        if i is None or j is None:
+            return error_response('Валюта не найдена', 404)
+
+        rate = cross[i][j]
+        if rate is None:
+            return error_response('Курс одной из валют равен нулю, конвертация невозможна', 422)
+        return web.json_response({
+            'from': from_name.upper(),
+            'to': to_name.upper(),
+            'original_amount': amount,
+            'converted_amount': round(amount * rate, 2),
+            'rate': rate
+        })
+
+    except Exception as e:
+        logging.error(f"Ошибка при конвертации валюты: {e}")
+        return error_response('Внутренняя ошибка сервера', 500)
+
+def build_cross_rates(rows):
+    """Матрица кросс-курсов: cross[i][j] - сколько единиц j стоит одна единица i"""
+    #курс меньше 0.005 хранится в NUMERIC(10, 2) как 0, такие пары отмечаются None
+    rub_rates = {row['currency_name']: float(row['rate']) for row in rows}
+    rub_rates.setdefault('RUB', 1.0)
+    cross_index = {name: i for i, name in enumerate(rub_rates)}
+    values = list(rub_rates.values())
+    cross = [
+        [rate_from / rate_to if rate_from > 0 and rate_to > 0 else None for rate_to in values]
+        for rate_from in values
+    ]
+    return cross_index, cross
+
+async def get_cross_rates(app):
+    """Матрица кросс-курсов, перестраивается только после уведомления об изменении"""
+    state = app['currencies']
+    snapshot = state['snapshot']
+    #без слушателя снимку нельзя доверять
+    if snapshot and state['listener_ok'] and snapshot[0] == state['version']:
+        return snapshot[1], snapshot[2]
+    version = state['version']
+    query = "SELECT currency_name, rate FROM currencies ORDER BY currency_name"
+    with query_stats.timed(query):
+        rows = await app['db_pool'].fetch(query, timeout=DB_QUERY_TIMEOUT)
+    cross_index, cross = build_cross_rates(rows)
+    state['snapshot'] = (version, cross_index, cross)
+    return cross_index, cross
+
+async def listen_currencies_changes(app):
+    """Отслеживание изменений таблицы currencies через LISTEN/NOTIFY"""
+    state = app['currencies']
+
+    def changed(*args):
+        state['version'] += 1
+
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(
+                database=DB_NAME,
+                user=DB_USER,
+                password=DB_PASSWORD,
+                host=DB_HOST,
+                port=DB_PORT
+            )
+            exists = await conn.fetchval(
+                "SELECT 1 FROM pg_trigger WHERE tgname = 'currencies_changed' AND tgrelid = 'currencies'::regclass"
+            )
+            #триггер создается один раз при первом подключении, если init_db еще не запускали
+            if not exists:
+                for statement in CURRENCIES_SCHEMA:
+                    await conn.execute(statement)
+                logging.info("Создан триггер currencies_changed")
+            closed = asyncio.Event()
+            conn.add_termination_listener(lambda connection: closed.set())
+            await conn.add_listener('currencies_changed', changed)
+            #изменения до подписки могли быть пропущены
+            state['version'] += 1
+            state['listener_ok'] = True
+            await closed.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Ошибка отслеживания изменений валют: {e}")
+        finally:
+            state['listener_ok'] = False
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(LISTEN_RETRY_INTERVAL)
+
+@routes.get('/currencies')
+async def get_all_currencies(request):
+    """Получение списка всех валют"""
+    try:
+        query = "SELECT currency_name, rate FROM currencies ORDER BY currency_name"
+        with query_stats.timed(query):
+            currencies = await request.app['db_pool'].fetch(query, timeout=DB_QUERY_TIMEOUT)
+        result = [{
+            'currency_name': currency['currency_name'],
+            'rate': float(currency['rate'])
+        } for currency in currencies]
+
+        response = web.json_response({'currencies': result})
+        etag = hashlib.sha1(response.body).hexdigest()
+        #ответ 304 при совпадении If-None-Match
+        if any(tag.value == etag for tag in request.if_none_match or ()):
+            response = web.Response(status=304)
+        response.etag = etag
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    except Exception as e:
+        logging.error(f"Ошибка при получении списка валют: {e}")
+        return error_response('Внутренняя ошибка сервера', 500)
+
+@web.middleware
+async def query_stats_middleware(request, handler):
+    """Учет запросов к базе данных для каждого HTTP-запроса"""
+    route = request.match_info.route.resource
+    name = route.canonical if route else 'unknown'
+    with query_stats.track(f"{request.method} {name}"):
+        return await handler(request)
+
+async def db_pool_context(app):
+    """Пул соединений на время работы приложения"""
+    app['db_pool'] = await asyncpg.create_pool(
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+        min_size=DB_POOL_MIN,
+        max_size=DB_POOL_MAX
+    )
+    yield
+    await app['db_pool'].close()
+
+async def currencies_listener_context(app):
+    """Слушатель изменений валют на время работы приложения"""
+    app['currencies'] = {'version': 0, 'listener_ok': False, 'snapshot': None}
+    listener = asyncio.create_task(listen_currencies_changes(app))
+    yield
+    listener.cancel()
+    try:
+        await listener
+    except asyncio.CancelledError:
+        pass
+
+def create_app():
+    app = web.Application(middlewares=[query_stats_middleware])
+    app.add_routes(routes)
+    app.cleanup_ctx.append(db_pool_context)
+    app.cleanup_ctx.append(currencies_listener_context)
+    return app
+
+if __name__ == '__main__':
+    web.run_app(create_app(), port=PORT)
@@ -1,6 +1,9 @@
 import asyncio
 import os
+import sys
 import logging
+import time
+from collections import OrderedDict
 import psycopg2
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, CommandStart
@@ -8,6 +11,12 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from dotenv import load_dotenv
+from prometheus_client import CollectorRegistry, Counter, start_http_server
+#общие модули лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import query_stats
+from bot_common import setup_metrics, setup_query_stats, run_bot
+from schema import create_currencies_schema
 
 #загрузка переменных окружения
 load_dotenv()
@@ -31,6 +40,19 @@ DB_PORT = os.getenv('DB_PORT', '5432')
 bot = Bot(token=API_TOKEN)
 dp = Dispatcher()
 
+#метрики бота в формате Prometheus
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9103'))
+metrics_registry = CollectorRegistry()
+DB_CONNECTIONS = Counter('db_connections_total', 'Количество открытых соединений с базой данных',
+                         registry=metrics_registry)
+DB_CONNECTION_ERRORS = Counter('db_connection_errors_total', 'Количество ошибок подключения к базе данных',
+                               registry=metrics_registry)
+
+setup_metrics(dp, metrics_registry)
+
+#учет запросов к базе данных в каждом обработчике
+setup_query_stats(dp)
+
 #состояния для FSM
 class CurrencyStates(StatesGroup):
     name = State()
@@ -44,33 +66,72 @@ class CurrencyStates(StatesGroup):
 #подключение к базе данных
 def get_db_connection():
     try:
-        return psycopg2.connect(
+        conn = psycopg2.connect(
             dbname=DB_NAME,
             user=DB_USER,
             password=DB_PASSWORD,
             host=DB_HOST,
-            port=DB_PORT
+            port=DB_PORT,
+            cursor_factory=query_stats.TracingCursor
         )
+        DB_CONNECTIONS.inc()
+        return conn
     except Exception as e:
+        DB_CONNECTION_ERRORS.inc()
         logging.error(f"Ошибка подключения к базе данных: {e}")
         return None
 
+#настройки кэша курсов валют
+RATE_CACHE_SIZE = int(os.getenv('RATE_CACHE_SIZE', '256'))
+RATE_CACHE_TTL = float(os.getenv('RATE_CACHE_TTL', '60'))
+RATE_CACHE_STATS_INTERVAL = float(os.getenv('RATE_CACHE_STATS_INTERVAL', '60'))
+
+#кэш курсов валют (LRU с ограничением по времени жизни)
+rate_cache = OrderedDict()
+rate_cache_stats = {"hits": 0, "misses": 0}
+
+#получение курса из кэша
+def rate_cache_get(currency_name):
+    entry = rate_cache.get(currency_name)
+    if entry is not None and entry[1] < time.monotonic():
+        del rate_cache[currency_name]
+        entry = None
+    if entry is None:
+        rate_cache_stats["misses"] += 1
+        return None
+    rate_cache.move_to_end(currency_name)
+    rate_cache_stats["hits"] += 1
+    return entry[0]
+
+#сохранение курса в кэш
+def rate_cache_put(currency_name, rate):
+    rate_cache[currency_name] = (rate, time.monotonic() + RATE_CACHE_TTL)
+    rate_cache.move_to_end(currency_name)
+    while len(rate_cache) > RATE_CACHE_SIZE:
+        rate_cache.popitem(last=False)
+
+#сброс курса в кэше после изменения валюты
+def rate_cache_invalidate(currency_name):
+    rate_cache.pop(currency_name, None)
+
+#периодический вывод статистики кэша курсов
+async def log_rate_cache_stats():
+    while True:
+        await asyncio.sleep(RATE_CACHE_STATS_INTERVAL)
+        logging.info(
+            f"кэш курсов: записей {len(rate_cache)}/{RATE_CACHE_SIZE}, "
+            f"попаданий {rate_cache_stats['hits']}, "
+            f"промахов {rate_cache_stats['misses']}"
+        )
+
 #инициализация базы данных
 def init_db():
     conn = None
     try:
         conn = get_db_connection()
         if conn:
-            with conn.cursor() as cur:
-                #создание таблицы currencies
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS currencies (
-                        id SERIAL PRIMARY KEY,
-                        currency_name VARCHAR(50) UNIQUE NOT NULL,
-                        rate NUMERIC(10, 2) NOT NULL
-                    )
-                """)
-                conn.commit()
+            #таблица currencies и триггер уведомлений для data_manager.py
+            create_currencies_schema(conn)
             logging.info("База данных успешно инициализирована")
     except Exception as e:
         logging.error(f"Ошибка при инициализации БД: {e}")
@@ -166,6 +227,7 @@ async def add_currency_rate(message: types.Message, state: FSMContext):
                     (currency_name, rate)
                 )
                 conn.commit()
+                rate_cache_invalidate(currency_name)
                 await message.answer(f"Валюта: {currency_name} успешно добавлена")
     except ValueError:
         await message.answer("Неверный формат курса. Введите число (например: 75.43 или 75,43).")
@@ -202,6 +264,7 @@ async def delete_currency(message: types.Message, state: FSMContext):
                 )
                 deleted = cur.fetchone()
                 conn.commit()
+                rate_cache_invalidate(currency_name)
                 
                 if deleted:
                     await message.answer(f"Валюта {currency_name} успешно удалена")
@@ -270,6 +333,7 @@ async def update_currency_rate(message: types.Message, state: FSMContext):
                     (new_rate, currency_name)
                 )
                 conn.commit()
+                rate_cache_invalidate(currency_name)
                 await message.answer(f"Курс валюты {currency_name} успешно изменен на {new_rate}")
     except ValueError:
         await message.answer("Неверный формат курса. Введите число (например: 75.43 или 75,43).")
@@ -316,22 +380,31 @@ async def cmd_convert(message: types.Message, state: FSMContext):
 @dp.message(CurrencyStates.convert_currency)
 async def convert_currency_name(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
+    conn = None
     
     try:
-        conn = get_db_connection()
-        if conn:
+        rate = rate_cache_get(currency_name)
+        if rate is None:
+            conn = get_db_connection()
+            if not conn:
+                await message.answer("Произошла ошибка. Попробуйте снова.")
+                await state.clear()
+                return
             with conn.cursor() as cur:
                 cur.execute("SELECT rate FROM currencies WHERE currency_name = %s", (currency_name,))
-                rate = cur.fetchone()
-                
-                if not rate:
-                    await message.answer(f"Валюта {currency_name} не найдена")
-                    await state.clear()
-                    return
-                
-                await state.update_data(currency_name=currency_name, rate=rate[0])
-                await state.set_state(CurrencyStates.convert_amount)
-                await message.answer("Введите сумму для конвертации:")
+                row = cur.fetchone()
+            
+            if not row:
+                await message.answer(f"Валюта {currency_name} не найдена")
+                await state.clear()
+                return
+            
+            rate = row[0]
+            rate_cache_put(currency_name, rate)
+        
+        await state.update_data(currency_name=currency_name, rate=rate)
+        await state.set_state(CurrencyStates.convert_amount)
+        await message.answer("Введите сумму для конвертации:")
     except Exception as e:
         logging.error(f"Ошибка при поиске валюты: {e}")
         await message.answer("Произошла ошибка. Попробуйте снова.")
@@ -365,7 +438,12 @@ async def convert_currency_amount(message: types.Message, state: FSMContext):
 
 async def main():
     init_db()
-    await dp.start_polling(bot)
+    start_http_server(METRICS_PORT, registry=metrics_registry)
+    cache_stats_task = asyncio.create_task(log_rate_cache_stats())
+    try:
+        await run_bot(dp, bot, default_webhook_port=8083)
+    finally:
+        cache_stats_task.cancel()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+import aiohttp
+import psycopg2
+from dotenv import load_dotenv
+from benchmark import percentile
+from schema import create_currencies_schema
+
+#нагрузочный тест currency_maneger.py (5001) и data_manager.py (5002)
+#тест работает только с отдельной базой LOAD_TEST_DB_NAME, сервисы запускаются с ней же
+#пример: LOAD_TEST_DB_NAME=currency_load_test python load_test.py --concurrency 50 --duration 30
+
+load_dotenv()
+
+DB_NAME = os.getenv('DB_NAME', 'currency_db')
+DB_USER = os.getenv('DB_USER', 'postgres')
+DB_PASSWORD = os.getenv('DB_PASSWORD', 'postgres')
+DB_HOST = os.getenv('DB_HOST', 'localhost')
+DB_PORT = os.getenv('DB_PORT', '5432')
+
+#база для нагрузочного теста, рабочая база DB_NAME не используется
+LOAD_TEST_DB_NAME = os.getenv('LOAD_TEST_DB_NAME')
+
+CURRENCY_MANAGER_URL = 'http://localhost:5001'
+DATA_MANAGER_URL = 'http://localhost:5002'
+
+#доля каждого запроса в смешанной нагрузке
+DEFAULT_MIX = {
+    'load': 10,
+    'update_currency': 10,
+    'delete': 5,
+    'convert': 60,
+    'currencies': 15,
+}
+
+#префикс валют теста: из-за "_" он не совпадает ни с одним трехбуквенным кодом ISO
+TEST_PREFIX = 'LOADTEST_'
+
+#валюты, которые всегда есть в таблице, одна из них "горячая" для всех потоков
+BASE_CURRENCIES = {
+    TEST_PREFIX + 'USD': 90.0,
+    TEST_PREFIX + 'EUR': 100.0,
+    TEST_PREFIX + 'CNY': 12.5,
+    TEST_PREFIX + 'HOT': 50.0,
+}
+
+def check_database():
+    """Отказ от запуска на рабочей базе"""
+    if not LOAD_TEST_DB_NAME:
+        raise SystemExit("Задайте LOAD_TEST_DB_NAME - отдельную базу для нагрузочного теста")
+    if LOAD_TEST_DB_NAME == DB_NAME:
+        raise SystemExit(f"LOAD_TEST_DB_NAME совпадает с рабочей базой {DB_NAME}")
+
+def prepare_database():
+    """Таблица currencies и базовый набор валют"""
+    conn = psycopg2.connect(dbname=LOAD_TEST_DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT)
+    try:
+        create_currencies_schema(conn)
+        with conn.cursor() as cur:
+            #валюты прошлых запусков теста
+            cur.execute(
+                "DELETE FROM currencies WHERE left(currency_name, %s) = %s",
+                (len(TEST_PREFIX), TEST_PREFIX)
+            )
+            for name, rate in BASE_CURRENCIES.items():
+                cur.execute(
+                    "INSERT INTO currencies (currency_name, rate) VALUES (%s, %s) "
+                    "ON CONFLICT (currency_name) DO UPDATE SET rate = EXCLUDED.rate",
+                    (name, rate)
+                )
+        conn.commit()
+    finally:
+        conn.close()
+
+def start_services():
+    """Запуск обоих сервисов в отдельных процессах на базе теста"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    #load_dotenv в сервисах не перезаписывает уже заданные переменные
+    env = dict(os.environ, DB_NAME=LOAD_TEST_DB_NAME)
+    return [
+        subprocess.Popen([sys.executable, os.path.join(here, script)], cwd=here, env=env,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for script in ('currency_maneger.py', 'data_manager.py')
+    ]
+
+async def wait_for_services(session, timeout=15):
+    deadline = time.monotonic() + timeout
+    for url in (CURRENCY_MANAGER_URL + '/delete', DATA_MANAGER_URL + '/currencies'):
+        while True:
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+                    break
+            except aiohttp.ClientError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Сервис {url} не запустился")
+                await asyncio.sleep(0.2)
+
+def make_request(kind, worker, counter):
+    """Метод, адрес и тело запроса заданного типа"""
+    if kind == 'load':
+        #часть добавлений конкурирует за одну валюту и должна получать 409
+        name = TEST_PREFIX + 'HOT' if random.random() < 0.2 else f'{TEST_PREFIX}{worker}_{counter}'
+        return 'POST', CURRENCY_MANAGER_URL + '/load', {'currency_name': name, 'rate': random.uniform(1, 100)}
+    if kind == 'update_currency':
+        name = random.choice(list(BASE_CURRENCIES))
+        return 'POST', CURRENCY_MANAGER_URL + '/update_currency', {'currency_name': name, 'rate': random.uniform(1, 100)}
+    if kind == 'delete':
+        return 'POST', CURRENCY_MANAGER_URL + '/delete', {'currency_name': f'{TEST_PREFIX}{worker}_{random.randrange(counter + 1)}'}
+    if kind == 'convert':
+        name = random.choice(list(BASE_CURRENCIES))
+        return 'GET', DATA_MANAGER_URL + f'/convert?currency={name}&amount={random.randint(1, 10000)}', None
+    return 'GET', DATA_MANAGER_URL + '/currencies', None
+
+async def run_mix(session, mix, concurrency, duration):
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    latencies = {kind: [] for kind in kinds}
+    statuses = {kind: {} for kind in kinds}
+    deadline = time.monotonic() + duration
+
+    async def worker(number):
+        counter = 0
+        while time.monotonic() < deadline:
+            kind = random.choices(kinds, weights)[0]
+            method, url, body = make_request(kind, number, counter)
+            counter += 1
+            started = time.perf_counter()
+            try:
+                async with session.request(method, url, json=body) as response:
+                    await response.read()
+                    status = str(response.status)
+            except aiohttp.ClientError:
+                status = 'error'
+            latencies[kind].append(time.perf_counter() - started)
+            statuses[kind][status] = statuses[kind].get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    report = {}
+    for kind in kinds:
+        values = sorted(latencies[kind])
+        report[kind] = {
+            'requests': len(values),
+            'rps': len(values) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'statuses': statuses[kind],
+        }
+    return elapsed, report
+
+async def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест сервисов lab-6')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--mix', default=None,
+                        help='доли запросов, например load=10,convert=80,currencies=10')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='load_test_results.json')
+    parser.add_argument('--no-start', action='store_true',
+                        help='сервисы уже запущены с DB_NAME, равным LOAD_TEST_DB_NAME')
+    args = parser.parse_args()
+
+    mix = DEFAULT_MIX
+    if args.mix:
+        mix = {kind: int(weight) for kind, weight in (item.split('=') for item in args.mix.split(','))}
+    random.seed(args.seed)
+
+    check_database()
+    prepare_database()
+    processes = [] if args.no_start else start_services()
+    try:
+        connector = aiohttp.TCPConnector(limit=args.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await wait_for_services(session)
+            elapsed, report = await run_mix(session, mix, args.concurrency, args.duration)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    result = {
+        'concurrency': args.concurrency,
+        'duration_s': elapsed,
+        'mix': mix,
+        'endpoints': report,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    print(f"{'маршрут':<16} {'запросов':>9} {'запр/с':>9} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for kind, stats in report.items():
+        print(f"{kind:<16} {stats['requests']:>9} {stats['rps']:>9.1f} {stats['p50_ms']:>8.2f} "
+              f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f}")
+    print(f"\nРезультаты сохранены в {args.output}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,44 @@
+#схема таблицы currencies, общая для lab6.py, data_manager.py, data_manager_async.py и load_test.py
+#все команды можно выполнять повторно: существующие объекты не пересоздаются и таблица не блокируется
+
+CURRENCIES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS currencies (
+        id SERIAL PRIMARY KEY,
+        currency_name VARCHAR(50) UNIQUE NOT NULL,
+        rate NUMERIC(10, 2) NOT NULL
+    )
+    """,
+    #уведомление data_manager.py об изменениях таблицы (LISTEN/NOTIFY)
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_proc WHERE proname = 'notify_currencies_changed') THEN
+            CREATE FUNCTION notify_currencies_changed() RETURNS trigger AS $fn$
+            BEGIN
+                PERFORM pg_notify('currencies_changed', '');
+                RETURN NULL;
+            END;
+            $fn$ LANGUAGE plpgsql;
+        END IF;
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_trigger
+            WHERE tgname = 'currencies_changed' AND tgrelid = 'currencies'::regclass
+        ) THEN
+            CREATE TRIGGER currencies_changed
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON currencies
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_currencies_changed();
+        END IF;
+    EXCEPTION WHEN duplicate_object OR duplicate_function THEN
+        NULL;
+    END;
+    $$
+    """,
+]
+
+def create_currencies_schema(conn):
+    """Создание таблицы currencies и триггера уведомлений через соединение psycopg2"""
+    with conn.cursor() as cur:
+        for statement in CURRENCIES_SCHEMA:
+            cur.execute(statement)
+    conn.commit()
@@ -1,12 +1,15 @@
 import asyncio
+import json
 import logging
 import os
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import Message
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from dotenv import load_dotenv
+from prometheus_client import CollectorRegistry, start_http_server
+from bot_common import setup_metrics, run_bot
 
 
 #загрузка переменных окружения из файла .env
@@ -22,9 +25,141 @@ logging.basicConfig(level=logging.INFO)
 bot = Bot(token=bot_token)
 dp = Dispatcher()
 
+#метрики бота в формате Prometheus
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9101'))
+metrics_registry = CollectorRegistry()
+
+setup_metrics(dp, metrics_registry)
+
 #словарь для хранения курсов валют
 currency = {}
 
+#файлы для сохранения курсов между перезапусками
+DATA_DIR = os.getenv('CURRENCY_DATA_DIR', 'data')
+SNAPSHOT_PATH = os.path.join(DATA_DIR, 'currency_snapshot.json')
+JOURNAL_PATH = os.path.join(DATA_DIR, 'currency_journal.log')
+ROTATED_JOURNAL_PATH = JOURNAL_PATH + '.1'
+#число записей в журнале, после которого делается снимок
+JOURNAL_COMPACT_EVERY = int(os.getenv('JOURNAL_COMPACT_EVERY', '10000'))
+
+journal = None
+journal_entries = 0
+compaction_task = None
+
+#применение записей журнала к словарю
+def replay_journal(path):
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    #конец последней полной строки
+    complete = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                #недописанная строка при аварийной остановке
+                break
+            complete += len(line)
+            try:
+                index, name, rate = json.loads(line)
+            except ValueError:
+                continue
+            currency[index] = {"name": name, "rate": rate}
+            count += 1
+    if complete < os.path.getsize(path):
+        #обрезка, чтобы следующая запись не склеилась с обрывком
+        logging.warning(f"Обрезана недописанная строка журнала {path}")
+        with open(path, 'r+b') as f:
+            f.truncate(complete)
+    return count
+
+#восстановление курсов: снимок, затем журналы
+def load_currency():
+    global journal, journal_entries
+    os.makedirs(DATA_DIR, exist_ok=True)
+    if os.path.exists(SNAPSHOT_PATH):
+        with open(SNAPSHOT_PATH, encoding='utf-8') as f:
+            for index, name, rate in json.load(f):
+                currency[index] = {"name": name, "rate": rate}
+    replay_journal(ROTATED_JOURNAL_PATH)
+    journal_entries = replay_journal(JOURNAL_PATH)
+    if os.path.exists(ROTATED_JOURNAL_PATH):
+        #завершение сжатия, прерванного при прошлой остановке
+        write_snapshot([[index, data["name"], data["rate"]] for index, data in currency.items()])
+    journal = open(JOURNAL_PATH, 'a', encoding='utf-8')
+    logging.info(f"Восстановлено курсов: {len(currency)}")
+
+#запись снимка и удаление уже учтенного журнала
+def write_snapshot(entries):
+    tmp_path = SNAPSHOT_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, SNAPSHOT_PATH)
+    os.remove(ROTATED_JOURNAL_PATH)
+
+#сжатие журнала в снимок в фоновом потоке
+async def compact_journal():
+    global journal, journal_entries
+    entries = [[index, data["name"], data["rate"]] for index, data in currency.items()]
+    if os.path.exists(ROTATED_JOURNAL_PATH):
+        #прошлый снимок не записался, его журнал нельзя перезаписывать:
+        #сначала повторяется снимок, текущий журнал сожмется при следующей записи
+        try:
+            await asyncio.to_thread(write_snapshot, entries)
+        except Exception as e:
+            logging.error(f"Ошибка при повторной записи снимка курсов: {e}")
+        return
+    #новые записи идут в свежий журнал, старый удаляется после снимка
+    journal.close()
+    os.replace(JOURNAL_PATH, ROTATED_JOURNAL_PATH)
+    journal = open(JOURNAL_PATH, 'a', encoding='utf-8')
+    journal_entries = 0
+    try:
+        await asyncio.to_thread(write_snapshot, entries)
+    except Exception as e:
+        logging.error(f"Ошибка при записи снимка курсов: {e}")
+
+#максимальная длина одной страницы /list (ограничение Telegram 4096 символов)
+LIST_PAGE_CHARS = int(os.getenv('LIST_PAGE_CHARS', '3500'))
+
+#готовые страницы списка курсов
+list_pages = []
+
+#добавление строки на последнюю страницу списка
+def add_list_entry(index, data):
+    line = f"{index}: {data['name']} - {data['rate']}\n"
+    if not list_pages or len(list_pages[-1]) + len(line) > LIST_PAGE_CHARS:
+        list_pages.append(line)
+    else:
+        list_pages[-1] += line
+
+#построение всех страниц после загрузки курсов
+def rebuild_list_pages():
+    list_pages.clear()
+    for index, data in currency.items():
+        add_list_entry(index, data)
+
+#текст и кнопки страницы списка
+def render_list_page(page):
+    text = f"Сохраненные курсы (стр. {page + 1}/{len(list_pages)}):\n" + list_pages[page]
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text="← Назад", callback_data=f"list:{page - 1}"))
+    if page < len(list_pages) - 1:
+        buttons.append(InlineKeyboardButton(text="Далее →", callback_data=f"list:{page + 1}"))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return text, keyboard
+
+#добавление записи в журнал
+def append_journal(index, name, rate):
+    global journal_entries, compaction_task
+    journal.write(json.dumps([index, name, rate], ensure_ascii=False) + "\n")
+    journal.flush()
+    journal_entries += 1
+    if journal_entries >= JOURNAL_COMPACT_EVERY and (compaction_task is None or compaction_task.done()):
+        compaction_task = asyncio.create_task(compact_journal())
+
 #сохранение валюты
 class SaveCurrency(StatesGroup):
     name = State()
@@ -66,7 +201,10 @@ async def save_currency_rate(message: Message, state: FSMContext):
         
         #генерируем новый индекс
         new_index = len(currency) + 1
+        #сначала журнал: при ошибке записи курс не появится в памяти без следа на диске
+        append_journal(new_index, currency_name, rate)
         currency[new_index] = {"name": currency_name, "rate": rate}
+        add_list_entry(new_index, currency[new_index])
         
         await state.clear()
         await message.answer(f"Курс {currency_name} ({rate}) сохранен под индексом {new_index}.")
@@ -83,14 +221,21 @@ async def save_currency_rate(message: Message, state: FSMContext):
 #вывод сохраненных курсов валют
 @dp.message(Command("list"))
 async def list_currency(message: Message):
-    if currency:
-        text = "Сохраненные курсы:\n"
-        for index, curr_data in currency.items():
-            text += f"{index}: {curr_data['name']} - {curr_data['rate']}\n"
-        await message.answer(text)
+    if list_pages:
+        text, keyboard = render_list_page(0)
+        await message.answer(text, reply_markup=keyboard)
     else:
         await message.answer("Курсы не сохранены. Используйте /save_currency.")
 
+#переключение страниц списка
+@dp.callback_query(F.data.startswith("list:"))
+async def list_currency_page(callback: CallbackQuery):
+    page = int(callback.data.split(":")[1])
+    if 0 <= page < len(list_pages):
+        text, keyboard = render_list_page(page)
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
 
 #/convert
 @dp.message(Command("convert"))
@@ -150,7 +295,15 @@ async def convert_currency_amount(message: Message, state: FSMContext):
         await state.clear()
 
 async def main():
-    await dp.start_polling(bot)
+    load_currency()
+    rebuild_list_pages()
+    start_http_server(METRICS_PORT, registry=metrics_registry)
+    try:
+        await run_bot(dp, bot, default_webhook_port=8081)
+    finally:
+        if compaction_task:
+            await compaction_task
+        journal.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,13 +1,21 @@
 import asyncio
 import os
 import logging
+import signal
+import time
+from collections import OrderedDict
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from dotenv import load_dotenv
+from prometheus_client import CollectorRegistry, Gauge, start_http_server
+from prometheus_client.core import CounterMetricFamily
+import query_stats
+from bot_common import setup_metrics, setup_query_stats, run_bot
 
 #загрузка переменных окружения
 load_dotenv()
@@ -29,6 +37,15 @@ DB_PORT = os.getenv('DB_PORT', '5432')
 bot = Bot(token=API_TOKEN)
 dp = Dispatcher()
 
+#метрики бота в формате Prometheus
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9102'))
+metrics_registry = CollectorRegistry()
+
+setup_metrics(dp, metrics_registry)
+
+#учет запросов к базе данных в каждом обработчике
+setup_query_stats(dp)
+
 #состояния для FSM
 class CurrencyStates(StatesGroup):
     name = State()
@@ -53,71 +70,253 @@ def currency_keyboard():
     )
     return keyboard
 
-#функция подключения к базе данных
-def db_connection():
+#настройки пула соединений
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+DB_POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', '30'))
+DB_POOL_STATS_INTERVAL = float(os.getenv('DB_POOL_STATS_INTERVAL', '60'))
+
+#пул соединений, общий для всех обработчиков
+db_pool = None
+db_pool_slots = None
+db_pool_stats = {"queries": 0, "timeouts": 0, "broken": 0}
+
+#соединение пула, которое помнит время последнего использования
+class PooledConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_used = time.monotonic()
+
+#создание пула соединений с базой данных
+def create_db_pool():
+    global db_pool, db_pool_slots
+    db_pool = ThreadedConnectionPool(
+        DB_POOL_MIN,
+        DB_POOL_MAX,
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+        connection_factory=PooledConnection,
+        cursor_factory=query_stats.TracingCursor
+    )
+    #семафор ограничивает число одновременных запросов размером пула
+    db_pool_slots = asyncio.Semaphore(DB_POOL_MAX)
+
+#проверка соединения, которое долго простаивало
+def connection_alive(conn):
     try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT
-        )
-        return conn
-    except Exception as e:
-        logging.error(f"Ошибка подключения к базе данных: {e}")
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+#получение живого соединения из пула
+def acquire_connection():
+    #замена тоже может оказаться разорванной, поэтому проверяется каждое соединение;
+    #если база недоступна, getconn выбросит ошибку при создании нового соединения
+    while True:
+        conn = db_pool.getconn()
+        if not conn.closed and (time.monotonic() - conn.last_used <= DB_POOL_PING_AFTER or connection_alive(conn)):
+            return conn
+        db_pool_stats["broken"] += 1
+        db_pool.putconn(conn, close=True)
+
+#выполнение запроса в отдельном потоке
+def run_query(query, params, fetch):
+    conn = acquire_connection()
+    broken = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            if fetch == "one":
+                result = cur.fetchone()
+            elif fetch == "all":
+                result = cur.fetchall()
+            else:
+                result = cur.rowcount
+        conn.commit()
+        return result
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.last_used = time.monotonic()
+        db_pool.putconn(conn, close=broken or bool(conn.closed))
+
+#неблокирующий запрос к базе данных через пул
+async def db_query(query, params=(), fetch=None):
+    try:
+        await asyncio.wait_for(db_pool_slots.acquire(), DB_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        db_pool_stats["timeouts"] += 1
+        raise
+    try:
+        db_pool_stats["queries"] += 1
+        return await asyncio.to_thread(run_query, query, params, fetch)
+    finally:
+        db_pool_slots.release()
+
+#состояние пула для Prometheus
+DB_POOL_IN_USE = Gauge('db_pool_connections_in_use', 'Занятые соединения пула', registry=metrics_registry)
+DB_POOL_IN_USE.set_function(lambda: len(db_pool._used) if db_pool else 0)
+DB_POOL_IDLE = Gauge('db_pool_connections_idle', 'Свободные соединения пула', registry=metrics_registry)
+DB_POOL_IDLE.set_function(lambda: len(db_pool._pool) if db_pool else 0)
+
+#счетчики пула берутся из db_pool_stats в момент сбора метрик
+class DbPoolStatsCollector:
+    def collect(self):
+        for key, name, documentation in (
+            ("queries", 'db_pool_queries', 'Запросы через пул с момента запуска'),
+            ("timeouts", 'db_pool_timeouts', 'Таймауты ожидания соединения'),
+            ("broken", 'db_pool_broken_connections', 'Замененные разорванные соединения'),
+        ):
+            counter = CounterMetricFamily(name, documentation)
+            counter.add_metric([], db_pool_stats[key])
+            yield counter
+
+metrics_registry.register(DbPoolStatsCollector())
+
+#статистика пула для логов
+def db_pool_info():
+    return (
+        f"пул БД: используется {len(db_pool._used)}/{DB_POOL_MAX}, "
+        f"свободно {len(db_pool._pool)}, "
+        f"запросов {db_pool_stats['queries']}, "
+        f"таймаутов {db_pool_stats['timeouts']}, "
+        f"переподключений {db_pool_stats['broken']}"
+    )
+
+#периодический вывод статистики пула
+async def log_db_pool_stats():
+    while True:
+        await asyncio.sleep(DB_POOL_STATS_INTERVAL)
+        logging.info(db_pool_info())
+
+#настройки кэша курсов валют
+RATE_CACHE_SIZE = int(os.getenv('RATE_CACHE_SIZE', '256'))
+RATE_CACHE_TTL = float(os.getenv('RATE_CACHE_TTL', '60'))
+RATE_CACHE_STATS_INTERVAL = float(os.getenv('RATE_CACHE_STATS_INTERVAL', '60'))
+
+#кэш курсов валют (LRU с ограничением по времени жизни)
+rate_cache = OrderedDict()
+rate_cache_stats = {"hits": 0, "misses": 0}
+#номер изменения каждой валюты: курс, прочитанный до изменения, в кэш не попадает
+rate_cache_generations = {}
+
+#получение курса из кэша
+def rate_cache_get(currency_name):
+    entry = rate_cache.get(currency_name)
+    if entry is not None and entry[1] < time.monotonic():
+        del rate_cache[currency_name]
+        entry = None
+    if entry is None:
+        rate_cache_stats["misses"] += 1
         return None
+    rate_cache.move_to_end(currency_name)
+    rate_cache_stats["hits"] += 1
+    return entry[0]
+
+#номер изменения валюты, читается до запроса к базе данных
+def rate_cache_generation(currency_name):
+    return rate_cache_generations.get(currency_name, 0)
+
+#сохранение курса в кэш, если валюта не менялась с момента чтения generation
+def rate_cache_put(currency_name, rate, generation):
+    if rate_cache_generations.get(currency_name, 0) != generation:
+        return
+    rate_cache[currency_name] = (rate, time.monotonic() + RATE_CACHE_TTL)
+    rate_cache.move_to_end(currency_name)
+    while len(rate_cache) > RATE_CACHE_SIZE:
+        rate_cache.popitem(last=False)
+
+#сброс курса в кэше после изменения валюты
+def rate_cache_invalidate(currency_name):
+    rate_cache_generations[currency_name] = rate_cache_generations.get(currency_name, 0) + 1
+    rate_cache.pop(currency_name, None)
+
+#периодический вывод статистики кэша курсов
+async def log_rate_cache_stats():
+    while True:
+        await asyncio.sleep(RATE_CACHE_STATS_INTERVAL)
+        logging.info(
+            f"кэш курсов: записей {len(rate_cache)}/{RATE_CACHE_SIZE}, "
+            f"попаданий {rate_cache_stats['hits']}, "
+            f"промахов {rate_cache_stats['misses']}"
+        )
 
 #функция для инициализации базы данных
-def init_db():
-    conn = None
+async def init_db():
     try:
-        conn = db_connection()
-        if conn:
-            with conn.cursor() as cur:
-                #создание таблицы currencies
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS currencies (
-                        id SERIAL PRIMARY KEY,
-                        currency_name VARCHAR(50) UNIQUE NOT NULL,
-                        rate NUMERIC(10, 2) NOT NULL
-                    )
-                """)
-                
-                #создание таблицы admins
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS admins (
-                        id SERIAL PRIMARY KEY,
-                        chat_id VARCHAR(50) UNIQUE NOT NULL
-                    )
-                """)
-                
-                conn.commit()
-            logging.info("База данных успешно инициализирована")
-        else:
-            logging.error("Не удалось подключиться к базе данных для инициализации")
+        #создание таблицы currencies
+        await db_query("""
+            CREATE TABLE IF NOT EXISTS currencies (
+                id SERIAL PRIMARY KEY,
+                currency_name VARCHAR(50) UNIQUE NOT NULL,
+                rate NUMERIC(10, 2) NOT NULL
+            )
+        """)
+
+        #создание таблицы admins
+        await db_query("""
+            CREATE TABLE IF NOT EXISTS admins (
+                id SERIAL PRIMARY KEY,
+                chat_id VARCHAR(50) UNIQUE NOT NULL
+            )
+        """)
+        logging.info("База данных успешно инициализирована")
     except Exception as e:
         logging.error(f"Ошибка при инициализации базы данных: {e}")
-    finally:
-        if conn:
-            conn.close()
 
-#проверка на администратора
-async def is_admin(chat_id):
-    conn = None
+#кэш администраторов
+ADMIN_CACHE_TTL = float(os.getenv('ADMIN_CACHE_TTL', '300'))
+admin_ids = frozenset()
+
+#загрузка списка администраторов из базы данных
+async def load_admins():
+    global admin_ids
     try:
-        conn = db_connection()
-        if conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1 FROM admins WHERE chat_id = %s", (str(chat_id),))
-                return bool(cur.fetchone())
-        return False
+        rows = await db_query("SELECT chat_id FROM admins", fetch="all")
+        admin_ids = frozenset(row[0] for row in rows)
+        logging.info(f"Загружено администраторов: {len(admin_ids)}")
     except Exception as e:
-        logging.error(f"Ошибка при проверке администратора: {e}")
-        return False
-    finally:
-        if conn:
-            conn.close()
+        #при ошибке остается предыдущий список
+        logging.error(f"Ошибка при загрузке администраторов: {e}")
+
+#периодическое обновление списка администраторов
+async def refresh_admins():
+    while True:
+        await asyncio.sleep(ADMIN_CACHE_TTL)
+        await load_admins()
+
+#задачи перезагрузки администраторов, ссылка хранится до их завершения
+admins_reload_tasks = set()
+
+def reload_admins():
+    task = asyncio.create_task(load_admins())
+    admins_reload_tasks.add(task)
+    task.add_done_callback(admins_reload_tasks.discard)
+
+#обновление списка администраторов по сигналу SIGHUP
+def setup_admins_reload_signal():
+    if not hasattr(signal, 'SIGHUP'):
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGHUP, reload_admins)
+    except NotImplementedError:
+        pass
+
+#проверка на администратора
+async def is_admin(chat_id):
+    return str(chat_id) in admin_ids
 
 #/start
 @dp.message(CommandStart())
@@ -171,24 +370,17 @@ async def add_currency_name(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
     
     try:
-        conn = db_connection()
-        if conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1 FROM currencies WHERE currency_name = %s", (currency_name,))
-                if cur.fetchone():
-                    await message.answer("Данная валюта уже существует")
-                    await state.clear()
-                    return
-                await state.update_data(currency_name=currency_name)
-                await state.set_state(CurrencyStates.rate)
-                await message.answer("Введите курс к рублю:")
+        if await db_query("SELECT 1 FROM currencies WHERE currency_name = %s", (currency_name,), fetch="one"):
+            await message.answer("Данная валюта уже существует")
+            await state.clear()
+            return
+        await state.update_data(currency_name=currency_name)
+        await state.set_state(CurrencyStates.rate)
+        await message.answer("Введите курс к рублю:")
     except Exception as e:
         logging.error(f"Ошибка при проверке валюты: {e}")
         await message.answer("Произошла ошибка. Попробуйте снова.")
         await state.clear()
-    finally:
-        if conn:
-            conn.close()
 
 #получение курса валюты для добавления
 @dp.message(CurrencyStates.rate)
@@ -201,15 +393,12 @@ async def add_currency_rate(message: types.Message, state: FSMContext):
         data = await state.get_data()
         currency_name = data["currency_name"]
         
-        conn = db_connection()
-        if conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO currencies (currency_name, rate) VALUES (%s, %s)",
-                    (currency_name, rate)
-                )
-                conn.commit()
-                await message.answer(f"Валюта: {currency_name} успешно добавлена")
+        await db_query(
+            "INSERT INTO currencies (currency_name, rate) VALUES (%s, %s)",
+            (currency_name, rate)
+        )
+        rate_cache_invalidate(currency_name)
+        await message.answer(f"Валюта: {currency_name} успешно добавлена")
     except ValueError:
         await message.answer("Неверный формат курса. Введите число (например: 75.43 или 75,43).")
         return
@@ -218,8 +407,6 @@ async def add_currency_rate(message: types.Message, state: FSMContext):
         await message.answer("Произошла ошибка. Попробуйте снова.")
     finally:
         await state.clear()
-        if conn:
-            conn.close()
 
 #кнопка "Удалить валюту"
 @dp.message(F.text == "Удалить валюту")
@@ -240,26 +427,21 @@ async def delete_currency(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
     
     try:
-        conn = db_connection()
-        if conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "DELETE FROM currencies WHERE currency_name = %s RETURNING currency_name",
-                    (currency_name,)
-                )
-                deleted = cur.fetchone()
-                conn.commit()
-                if deleted:
-                    await message.answer(f"Валюта {currency_name} успешно удалена")
-                else:
-                    await message.answer(f"Валюта {currency_name} не найдена")
+        deleted = await db_query(
+            "DELETE FROM currencies WHERE currency_name = %s RETURNING currency_name",
+            (currency_name,),
+            fetch="one"
+        )
+        rate_cache_invalidate(currency_name)
+        if deleted:
+            await message.answer(f"Валюта {currency_name} успешно удалена")
+        else:
+            await message.answer(f"Валюта {currency_name} не найдена")
     except Exception as e:
         logging.error(f"Ошибка при удалении валюты: {e}")
         await message.answer("Произошла ошибка. Попробуйте снова.")
     finally:
         await state.clear()
-        if conn:
-            conn.close()
 
 #кнопка "Изменить курс валюты"
 @dp.message(F.text == "Изменить курс валюты")
@@ -279,24 +461,17 @@ async def update_currency_start(message: types.Message, state: FSMContext):
 async def update_currency_name(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
     try:
-        conn = db_connection()
-        if conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1 FROM currencies WHERE currency_name = %s", (currency_name,))
-                if not cur.fetchone():
-                    await message.answer(f"Валюта {currency_name} не найдена")
-                    await state.clear()
-                    return
-                await state.update_data(currency_name=currency_name)
-                await state.set_state(CurrencyStates.new_rate)
-                await message.answer("Введите новый курс к рублю:")
+        if not await db_query("SELECT 1 FROM currencies WHERE currency_name = %s", (currency_name,), fetch="one"):
+            await message.answer(f"Валюта {currency_name} не найдена")
+            await state.clear()
+            return
+        await state.update_data(currency_name=currency_name)
+        await state.set_state(CurrencyStates.new_rate)
+        await message.answer("Введите новый курс к рублю:")
     except Exception as e:
         logging.error(f"Ошибка при проверке валюты: {e}")
         await message.answer("Произошла ошибка. Попробуйте снова.")
         await state.clear()
-    finally:
-        if conn:
-            conn.close()
 
 #обновление курса валюты
 @dp.message(CurrencyStates.new_rate)
@@ -308,15 +483,12 @@ async def update_currency_rate(message: types.Message, state: FSMContext):
             return
         data = await state.get_data()
         currency_name = data["currency_name"]
-        conn = db_connection()
-        if conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE currencies SET rate = %s WHERE currency_name = %s",
-                    (new_rate, currency_name)
-                )
-                conn.commit()
-                await message.answer(f"Курс валюты {currency_name} успешно изменен на {new_rate}")
+        await db_query(
+            "UPDATE currencies SET rate = %s WHERE currency_name = %s",
+            (new_rate, currency_name)
+        )
+        rate_cache_invalidate(currency_name)
+        await message.answer(f"Курс валюты {currency_name} успешно изменен на {new_rate}")
     except ValueError:
         await message.answer("Неверный формат курса. Введите число (например: 75.43 или 75,43).")
         return
@@ -325,31 +497,25 @@ async def update_currency_rate(message: types.Message, state: FSMContext):
         await message.answer("Произошла ошибка. Попробуйте снова.")
     finally:
         await state.clear()
-        if conn:
-            conn.close()
 
 #/get_currencies
 @dp.message(Command("get_currencies"))
 async def cmd_get_currencies(message: types.Message):
     try:
-        conn = db_connection()
-        if conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT currency_name, rate FROM currencies ORDER BY currency_name")
-                currencies = cur.fetchall()
-                if currencies:
-                    response = "Список валют и их курсов к рублю:\n"
-                    for currency in currencies:
-                        response += f"{currency[0]}: {currency[1]}\n"
-                    await message.answer(response)
-                else:
-                    await message.answer("В базе данных нет сохраненных валют")
+        currencies = await db_query(
+            "SELECT currency_name, rate FROM currencies ORDER BY currency_name",
+            fetch="all"
+        )
+        if currencies:
+            response = "Список валют и их курсов к рублю:\n"
+            for currency in currencies:
+                response += f"{currency[0]}: {currency[1]}\n"
+            await message.answer(response)
+        else:
+            await message.answer("В базе данных нет сохраненных валют")
     except Exception as e:
         logging.error(f"Ошибка при получении списка валют: {e}")
         await message.answer("Произошла ошибка при получении списка валют")
-    finally:
-        if conn:
-            conn.close()
 
 #/convert 
 @dp.message(Command("convert"))
@@ -363,27 +529,26 @@ async def convert_currency_name(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
     
     try:
-        conn = db_connection()
-        if conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT rate FROM currencies WHERE currency_name = %s", (currency_name,))
-                rate = cur.fetchone()
-                
-                if not rate:
-                    await message.answer(f"Валюта {currency_name} не найдена")
-                    await state.clear()
-                    return
-                
-                await state.update_data(currency_name=currency_name, rate=rate[0])
-                await state.set_state(CurrencyStates.convert_amount)
-                await message.answer("Введите сумму для конвертации:")
+        rate = rate_cache_get(currency_name)
+        if rate is None:
+            generation = rate_cache_generation(currency_name)
+            row = await db_query("SELECT rate FROM currencies WHERE currency_name = %s", (currency_name,), fetch="one")
+            
+            if not row:
+                await message.answer(f"Валюта {currency_name} не найдена")
+                await state.clear()
+                return
+            
+            rate = row[0]
+            rate_cache_put(currency_name, rate, generation)
+        
+        await state.update_data(currency_name=currency_name, rate=rate)
+        await state.set_state(CurrencyStates.convert_amount)
+        await message.answer("Введите сумму для конвертации:")
     except Exception as e:
         logging.error(f"Ошибка при поиске валюты: {e}")
         await message.answer("Произошла ошибка. Попробуйте снова.")
         await state.clear()
-    finally:
-        if conn:
-            conn.close()
 
 #конвертация валюты
 @dp.message(CurrencyStates.convert_amount)
@@ -411,8 +576,22 @@ async def convert_currency_amount(message: types.Message, state: FSMContext):
 
 #запуск бота
 async def main():
-    init_db()
-    await dp.start_polling(bot)
+    create_db_pool()
+    await init_db()
+    await load_admins()
+    setup_admins_reload_signal()
+    start_http_server(METRICS_PORT, registry=metrics_registry)
+    stats_task = asyncio.create_task(log_db_pool_stats())
+    admins_task = asyncio.create_task(refresh_admins())
+    cache_stats_task = asyncio.create_task(log_rate_cache_stats())
+    try:
+        await run_bot(dp, bot, default_webhook_port=8082)
+    finally:
+        stats_task.cancel()
+        admins_task.cancel()
+        cache_stats_task.cancel()
+        logging.info(db_pool_info())
+        db_pool.closeall()
 if __name__ == "__main__":
     asyncio.run(main())
 
@@ -0,0 +1,120 @@
+import os
+import re
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from psycopg2.extensions import cursor as base_cursor
+
+#учет запросов к базе данных по обработчикам и журнал медленных запросов
+#соединения создаются с cursor_factory=TracingCursor, обработчик оборачивается в track(имя)
+
+#порог медленного запроса в миллисекундах
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+#максимальная длина запроса в журнале
+SLOW_QUERY_MAX_LENGTH = 500
+
+logger = logging.getLogger('query_stats')
+
+#статистика текущего запроса или обработчика
+current_stats = ContextVar('current_stats', default=None)
+
+#накопленная статистика по обработчикам: {имя: {...}}
+handler_stats = {}
+#все запросы процесса, в том числе вне обработчиков
+totals = {"queries": 0, "db_time": 0.0}
+totals_lock = threading.Lock()
+
+#строки и числа в тексте запроса заменяются на ?
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|(?<![\w$.])\d+(?:\.\d+)?")
+
+def redact(query):
+    """Текст запроса без значений параметров и литералов"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    text = ' '.join(LITERAL_RE.sub('?', str(query)).split())
+    if len(text) > SLOW_QUERY_MAX_LENGTH:
+        text = text[:SLOW_QUERY_MAX_LENGTH] + '...'
+    return text
+
+def describe_params(params):
+    """Количество и типы параметров без самих значений"""
+    if params is None:
+        return 'нет'
+    if isinstance(params, dict):
+        return ', '.join(f"{key}={type(value).__name__}" for key, value in params.items())
+    return ', '.join(type(value).__name__ for value in params)
+
+def record(query, params, elapsed):
+    """Учет одного выполненного запроса"""
+    with totals_lock:
+        totals["queries"] += 1
+        totals["db_time"] += elapsed
+    stats = current_stats.get()
+    if stats is not None:
+        stats["queries"] += 1
+        stats["db_time"] += elapsed
+        if elapsed > stats["slowest_time"]:
+            stats["slowest_time"] = elapsed
+            stats["slowest"] = redact(query)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        name = stats["name"] if stats is not None else '-'
+        logger.warning(f"Медленный запрос ({elapsed * 1000:.1f} мс, {name}): {redact(query)} "
+                       f"[параметры: {describe_params(params)}]")
+
+@contextmanager
+def timed(query, params=None):
+    """Замер времени выполнения запроса любым драйвером"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(query, params, time.perf_counter() - started)
+
+class TracingCursor(base_cursor):
+    """Курсор psycopg2, который учитывает каждый execute"""
+    def execute(self, query, vars=None):
+        with timed(query, vars):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with timed(query):
+            return super().executemany(query, vars_list)
+
+def start(name):
+    """Начало учета для запроса или обработчика, возвращает токен для finish"""
+    return current_stats.set({"name": name, "queries": 0, "db_time": 0.0, "slowest": None, "slowest_time": 0.0})
+
+def finish(token):
+    """Завершение учета: итог попадает в handler_stats и в журнал"""
+    stats = current_stats.get()
+    current_stats.reset(token)
+    if stats is None or not stats["queries"]:
+        return
+    with totals_lock:
+        summary = handler_stats.setdefault(stats["name"], {
+            "calls": 0, "queries": 0, "db_time": 0.0, "slowest": None, "slowest_time": 0.0
+        })
+        summary["calls"] += 1
+        summary["queries"] += stats["queries"]
+        summary["db_time"] += stats["db_time"]
+        if stats["slowest_time"] > summary["slowest_time"]:
+            summary["slowest_time"] = stats["slowest_time"]
+            summary["slowest"] = stats["slowest"]
+    #итог каждого запроса нужен только при отладке, медленные попадают в журнал всегда
+    level = logging.INFO if stats["db_time"] * 1000 >= SLOW_QUERY_MS else logging.DEBUG
+    if not logger.isEnabledFor(level):
+        return
+    logger.log(level, f"{stats['name']}: запросов {stats['queries']}, "
+               f"время БД {stats['db_time'] * 1000:.1f} мс, "
+               f"самый долгий {stats['slowest_time'] * 1000:.1f} мс: {stats['slowest']}")
+
+@contextmanager
+def track(name):
+    """Учет запросов внутри блока"""
+    token = start(name)
+    try:
+        yield
+    finally:
+        finish(token)
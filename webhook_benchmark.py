@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+from itertools import count
+from aiohttp import web, ClientSession
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from dispatcher_benchmark import load_bot_module, prepare_bot
+import bot_common
+
+#задержка ответа ботов в режимах polling и webhook на локальном поддельном Bot API
+#задержка - время от появления обновления до первого sendMessage в тот же чат
+#пример: python webhook_benchmark.py --bots lab4,rgzbot --updates 500 --concurrency 10
+
+WEBHOOK_SECRET = 'benchmark-secret'
+
+#сколько ждать ответа бота на одно обновление
+REPLY_TIMEOUT = 10
+
+#сервер, который отвечает на вызовы Bot API вместо Telegram
+class FakeBotAPI:
+    def __init__(self):
+        self.updates = []
+        self.updates_changed = asyncio.Condition()
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.webhook_set = asyncio.Event()
+        self.waiting = {}
+        self.message_ids = count(1)
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = dict(await request.post())
+        if method == 'getUpdates':
+            result = await self.get_updates(params)
+        elif method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        elif method == 'setWebhook':
+            self.webhook_url = params['url']
+            self.webhook_secret = params.get('secret_token')
+            self.webhook_set.set()
+            result = True
+        elif method in ('sendMessage', 'editMessageText'):
+            chat_id = int(params['chat_id'])
+            self.answered(chat_id)
+            result = {
+                'message_id': next(self.message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': params.get('text', ''),
+            }
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def get_updates(self, params):
+        """Длинный опрос: ответ сразу при появлении обновлений или по таймауту"""
+        offset = int(params.get('offset', 0))
+        timeout = float(params.get('timeout', 0))
+        async with self.updates_changed:
+            self.updates = [update for update in self.updates if update['update_id'] >= offset]
+            if not self.updates:
+                try:
+                    await asyncio.wait_for(self.updates_changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return list(self.updates)
+
+    def answered(self, chat_id):
+        entry = self.waiting.pop(chat_id, None)
+        if entry and not entry[1].done():
+            started, future = entry
+            future.set_result(time.perf_counter() - started)
+
+    async def push_update(self, update):
+        async with self.updates_changed:
+            self.updates.append(update)
+            self.updates_changed.notify_all()
+
+def make_update(update_id, chat_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': '/start',
+        },
+    }
+
+async def measure(api, deliver, updates, concurrency):
+    """Отправка обновлений и сбор задержек до ответа бота"""
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    acks = []
+    lost = 0
+
+    async def send(update):
+        nonlocal lost
+        async with slots:
+            future = loop.create_future()
+            started = time.perf_counter()
+            api.waiting[update['message']['chat']['id']] = (started, future)
+            ack = await deliver(update)
+            if ack is not None:
+                acks.append(ack)
+            try:
+                latencies.append(await asyncio.wait_for(future, REPLY_TIMEOUT))
+            except asyncio.TimeoutError:
+                lost += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(update) for update in updates))
+    return time.perf_counter() - started, latencies, acks, lost
+
+def summary(elapsed, latencies, acks, lost, total):
+    def p(values, q):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+    result = {
+        'updates': total,
+        'lost': lost,
+        'updates_per_sec': total / elapsed if elapsed else 0.0,
+        'p50_ms': p(latencies, 0.5),
+        'p95_ms': p(latencies, 0.95),
+        'p99_ms': p(latencies, 0.99),
+    }
+    if acks:
+        result['ack_p95_ms'] = p(acks, 0.95)
+    return result
+
+async def run_polling(name, api, api_url, updates, concurrency):
+    module = load_bot_module(name)
+    module.bot.session = AiohttpSession(api=TelegramAPIServer.from_base(api_url))
+    await prepare_bot(name, module)
+    task = asyncio.create_task(module.dp.start_polling(module.bot, polling_timeout=1, handle_signals=False))
+    try:
+        result = await measure(api, api.push_update, updates, concurrency)
+    finally:
+        await module.dp.stop_polling()
+        await task
+        await module.bot.session.close()
+    return result
+
+async def run_webhook(name, api, api_url, updates, concurrency):
+    module = load_bot_module(name)
+    module.bot.session = AiohttpSession(api=TelegramAPIServer.from_base(api_url))
+    await prepare_bot(name, module)
+    api.webhook_set.clear()
+    task = asyncio.create_task(bot_common.run_webhook(module.dp, module.bot, int(os.environ['WEBHOOK_PORT'])))
+    await asyncio.wait_for(api.webhook_set.wait(), 10)
+
+    async with ClientSession() as session:
+        #обновление с неверным секретом должно отклоняться
+        async with session.post(api.webhook_url, json=make_update(0, 1),
+                                headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'}) as response:
+            rejected = response.status
+
+        async def deliver(update):
+            started = time.perf_counter()
+            async with session.post(api.webhook_url, json=update,
+                                    headers={'X-Telegram-Bot-Api-Secret-Token': api.webhook_secret}) as response:
+                await response.read()
+            return time.perf_counter() - started
+
+        try:
+            result = await measure(api, deliver, updates, concurrency)
+        finally:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    return result, rejected
+
+async def main():
+    parser = argparse.ArgumentParser(description='Задержка ответа ботов: polling и webhook')
+    parser.add_argument('--bots', default='lab4,lab5,lab6,rgzbot')
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--api-port', type=int, default=8090)
+    parser.add_argument('--webhook-port', type=int, default=8091)
+    parser.add_argument('--output', default=None, help='файл для результатов в JSON')
+    args = parser.parse_args()
+
+    #настройки webhook читаются ботами при импорте
+    os.environ['WEBHOOK_SECRET'] = WEBHOOK_SECRET
+    os.environ['WEBHOOK_HOST'] = '127.0.0.1'
+    os.environ['WEBHOOK_PORT'] = str(args.webhook_port)
+    os.environ['WEBHOOK_URL'] = f'http://127.0.0.1:{args.webhook_port}'
+
+    api = FakeBotAPI()
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', args.api_port).start()
+    api_url = f'http://127.0.0.1:{args.api_port}'
+
+    update_ids = count(1)
+    def batch():
+        return [make_update(next(update_ids), 200000 + i) for i in range(args.updates)]
+
+    results = {}
+    try:
+        for name in args.bots.split(','):
+            polling = summary(*await run_polling(name, api, api_url, batch(), args.concurrency), args.updates)
+            measured, rejected = await run_webhook(name, api, api_url, batch(), args.concurrency)
+            webhook = summary(*measured, args.updates)
+            webhook['wrong_secret_status'] = rejected
+            results[name] = {'polling': polling, 'webhook': webhook}
+    finally:
+        await runner.cleanup()
+
+    print(f"{'бот':<8} {'режим':<8} {'обн/с':>8} {'p50, мс':>8} {'p95, мс':>8} {'p99, мс':>8} {'потеряно':>9}")
+    for name, modes in results.items():
+        for mode, stats in modes.items():
+            print(f"{name:<8} {mode:<8} {stats['updates_per_sec']:>8.1f} {stats['p50_ms']:>8.2f} "
+                  f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['lost']:>9}")
+        webhook = modes['webhook']
+        print(f"{'':<8} ответ webhook p95 {webhook.get('ack_p95_ms', 0.0):.2f} мс, "
+              f"неверный секрет -> {webhook['wrong_secret_status']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    asyncio.run(main())